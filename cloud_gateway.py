@@ -213,10 +213,15 @@ class LLMGateway:
         }
 
 
+# Built at import, once per Lambda container; warm invocations reuse its
+# compiled patterns instead of recompiling them per request
+_GATEWAY = LLMGateway()
+
+
 # AWS Lambda handler
 def lambda_handler(event, context):
     """AWS Lambda entry point"""
-    gateway = LLMGateway()
+    gateway = _GATEWAY
     
     method = event.get('httpMethod', 'GET')
     path = event.get('path', '/')
@@ -319,12 +319,15 @@ class EnterpriseSecurityDetector:
         return self.stats.copy()
 
 
+# Built once per process and shared by every request, so its stats cover
+# the whole process rather than the current request
+_DETECTOR = EnterpriseSecurityDetector()
+
+
 class EnhancedGatewayHandler(http.server.BaseHTTPRequestHandler):
     """Enhanced HTTP handler with enterprise security"""
     
-    def __init__(self, *args, **kwargs):
-        self.detector = EnterpriseSecurityDetector()
-        super().__init__(*args, **kwargs)
+    detector = _DETECTOR
     
     def do_GET(self):
         """Handle GET requests"""
@@ -557,7 +560,7 @@ def main():
     print("Enhanced LLM Gateway - Enterprise Security Edition")
     print("=" * 60)
     print(f"Port: {PORT}")
-    print(f"Security Patterns: {len(EnterpriseSecurityDetector().patterns)}")
+    print(f"Security Patterns: {len(_DETECTOR.patterns)}")
     print(f"Features: Enterprise detection, Confidence scoring, Smart blocking")
     print("=" * 60)
     
@@ -62,13 +62,18 @@ class MockDeepSeekClient:
         }
 
 
+# Built once at import and shared by every request; the handler class is
+# instantiated per request, so building these in its __init__ recompiled the
+# patterns each time
+_SECRET_DETECTOR = SecretDetector()
+_DEEPSEEK_CLIENT = MockDeepSeekClient()
+
+
 class GatewayHandler(http.server.BaseHTTPRequestHandler):
     """HTTP request handler for the gateway"""
     
-    def __init__(self, *args, **kwargs):
-        self.secret_detector = SecretDetector()
-        self.deepseek_client = MockDeepSeekClient()
-        super().__init__(*args, **kwargs)
+    secret_detector = _SECRET_DETECTOR
+    deepseek_client = _DEEPSEEK_CLIENT
     
     def do_GET(self):
         """Handle GET requests"""
@@ -2,21 +2,28 @@
 Microsoft Presidio-Enhanced LLM Gateway
 Enterprise-grade PII detection using Microsoft Presidio + Custom patterns
 """
-import http.server
-import socketserver
-import json
 import re
 import os
+import sys
 import time
 import uuid
+import bisect
+import gc
 import asyncio
+import hashlib
 import logging
-from urllib.request import Request, urlopen
-from urllib.error import HTTPError
+import queue
+import concurrent.futures
+import multiprocessing
+from collections import OrderedDict
 from typing import List, Dict, Any, Tuple, Optional
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from enum import Enum
 
+import aiohttp
+import orjson
+from aiohttp import web
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -52,6 +59,30 @@ try:
 except ImportError:
     VALIDATORS_AVAILABLE = False
 
+try:
+    import regex
+    REGEX_AVAILABLE = True
+except ImportError:
+    REGEX_AVAILABLE = False
+
+try:
+    import pcre2
+    PCRE2_AVAILABLE = True
+except ImportError:
+    PCRE2_AVAILABLE = False
+
+try:
+    import hyperscan
+    HYPERSCAN_AVAILABLE = True
+except ImportError:
+    HYPERSCAN_AVAILABLE = False
+
+try:
+    import uvloop
+    UVLOOP_AVAILABLE = True
+except ImportError:
+    UVLOOP_AVAILABLE = False
+
 
 class DetectionLevel(Enum):
     """Detection confidence levels"""
@@ -61,7 +92,81 @@ class DetectionLevel(Enum):
     CRITICAL = 0.95
 
 
-@dataclass
+# Severity thresholds in ascending order; bisecting a confidence into them gives the
+# index of its level in _SEVERITY_LEVELS
+_SEVERITY_THRESHOLDS = (DetectionLevel.MEDIUM.value, DetectionLevel.HIGH.value, DetectionLevel.CRITICAL.value)
+_SEVERITY_LEVELS = (DetectionLevel.LOW, DetectionLevel.MEDIUM, DetectionLevel.HIGH, DetectionLevel.CRITICAL)
+
+# Entities requested from Presidio on every scan
+PRESIDIO_ENTITIES = (
+    "CREDIT_CARD", "EMAIL_ADDRESS", "IBAN_CODE", "IP_ADDRESS",
+    "PERSON", "PHONE_NUMBER", "US_SSN", "US_PASSPORT",
+    "US_DRIVER_LICENSE", "DATE_TIME", "LOCATION", "URL",
+    "US_BANK_NUMBER", "CRYPTO", "MEDICAL_LICENSE",
+    # Custom entities
+    "API_KEY", "DATABASE_CREDENTIAL", "JWT_TOKEN"
+)
+
+# Common words spaCy mislabels as PERSON
+PERSON_FALSE_POSITIVES = frozenset({
+    'you', 'i', 'me', 'we', 'they', 'he', 'she', 'it',
+    'today', 'tomorrow', 'yesterday', 'now', 'here', 'there',
+    'hello', 'hi', 'hey', 'thanks', 'please', 'yes', 'no',
+    'task', 'code', 'help', 'how', 'what', 'when', 'where', 'why',
+    'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to',
+    'for', 'with', 'by', 'from', 'about', 'into', 'through', 'during'
+})
+
+# Shared detector labels so every SecurityIssue references the same string
+DETECTOR_PRESIDIO = sys.intern("presidio")
+DETECTOR_CUSTOM_REGEX = sys.intern("custom_regex")
+
+# Chat request bodies above this are rejected with 413 before being read
+MAX_BODY_BYTES = 1 << 20
+
+# Everything Python's str \s matches. PCRE2 and the regex module leave out
+# \x1c-\x1f (PCRE2 also adds U+180E), so patterns get this class spelled out
+# before either compiles them.
+_PYTHON_WHITESPACE = '\t-\r\x1c- \x85\xa0\u1680\u2000-\u200a\u2028\u2029\u202f\u205f\u3000'
+
+# ASCII whitespace to Python that Hyperscan's \s does not match
+_HYPERSCAN_NARROW_SPACE = re.compile('[\x1c-\x1f]')
+
+
+def _spell_out_whitespace(pattern: str) -> str:
+    """Replace \\s and \\S in pattern with explicit classes of Python's whitespace"""
+    out = []
+    in_class = False
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if char == '\\' and index + 1 < len(pattern):
+            escaped = pattern[index + 1]
+            if escaped == 's':
+                out.append(_PYTHON_WHITESPACE if in_class else f'[{_PYTHON_WHITESPACE}]')
+            elif escaped == 'S' and not in_class:
+                out.append(f'[^{_PYTHON_WHITESPACE}]')
+            else:
+                out.append(pattern[index:index + 2])
+            index += 2
+            continue
+        if char == '[' and not in_class:
+            in_class = True
+            # A ']' right after the opening bracket (or '[^') is a literal
+            start = index + 2 if pattern.startswith('[^', index) else index + 1
+            if pattern.startswith(']', start):
+                start += 1
+            out.append(pattern[index:start])
+            index = start
+            continue
+        if char == ']' and in_class:
+            in_class = False
+        out.append(char)
+        index += 1
+    return ''.join(out)
+
+
+@dataclass(slots=True)
 class SecurityIssue:
     """Represents a detected security issue"""
     type: str
@@ -69,7 +174,7 @@ class SecurityIssue:
     confidence: float
     location: Tuple[int, int]
     severity: DetectionLevel
-    context: str
+    context_span: Tuple[int, int]  # slice of the scanned text, materialized on demand
     detector: str
     entity_text: str = ""
 
@@ -79,10 +184,23 @@ class PresidioSecurityDetector:
 
     def __init__(self):
         self.presidio_analyzer = None
+        self._analyzer_pool = None
         self.presidio_anonymizer = None
         self.custom_patterns = self._load_custom_patterns()
-        self.compiled_patterns = self._compile_custom_patterns()
+        self._compile_custom_patterns()
+        # Bound per-pattern work on adversarial inputs (e.g. thousands of fake emails)
+        self.max_matches_per_pattern = 64
+        # NER cost grows with input length; regexes still see the full text
+        self.max_presidio_chars = 50000
         self.initialized = False
+        # Concurrent Presidio scans are coalesced into one spaCy batch
+        self.max_batch_size = 32
+        self.max_batch_wait = 0.001
+        self._batch_pending = []
+        self._batch_task = None
+        self._batch_runs = set()
+        # spaCy releases the GIL during inference, so batches run off the event loop
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count())
         self.stats = {
             'total_scans': 0,
             'presidio_scans': 0,
@@ -109,48 +227,67 @@ class PresidioSecurityDetector:
         try:
             logger.info("🔧 Setting up Presidio NLP engine...")
 
+            # Small model by default; set PRESIDIO_SPACY_MODEL=en_core_web_lg for accuracy
+            model_name = os.getenv("PRESIDIO_SPACY_MODEL", "en_core_web_sm")
+
             # Try to download spaCy model if not available
-            try:
-                import spacy
-                spacy.load("en_core_web_sm")
-            except OSError:
-                logger.info("📥 Downloading spaCy model...")
+            if not spacy.util.is_package(model_name):
+                logger.info(f"📥 Downloading spaCy model {model_name}...")
                 import subprocess
-                subprocess.run(["python", "-m", "spacy", "download", "en_core_web_sm"], check=True)
-
-            # Configure NLP engine with spaCy
-            configuration = {
-                "nlp_engine_name": "spacy",
-                "models": [{"lang_code": "en", "model_name": "en_core_web_sm"}],
-            }
+                subprocess.run([sys.executable, "-m", "spacy", "download", model_name], check=True)
 
-            # Create NLP engine provider
-            provider = NlpEngineProvider(nlp_configuration=configuration)
-            nlp_engine = provider.create_engine()
+            # Each analyzer owns its spaCy pipeline, so concurrent batches don't contend on one
+            # Language/Vocab. Every extra analyzer costs another copy of the model in memory.
+            pool_size = max(1, int(os.getenv("DETECTOR_POOL", "4")))
+            analyzers = [self._build_analyzer(model_name) for _ in range(pool_size)]
 
-            # Create recognizer registry with custom recognizers
-            registry = RecognizerRegistry()
-            registry.load_predefined_recognizers()
+            self._analyzer_pool = queue.Queue()
+            for analyzer in analyzers:
+                self._analyzer_pool.put(analyzer)
+            self.presidio_analyzer = analyzers[0]
 
-            # Add custom recognizers
-            self._add_custom_recognizers(registry)
-
-            # Create analyzer
-            self.presidio_analyzer = AnalyzerEngine(
-                nlp_engine=nlp_engine,
-                registry=registry
-            )
+            # One executor thread per pooled analyzer
+            self._pool.shutdown(wait=False)
+            self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=pool_size)
 
             # Create anonymizer
             self.presidio_anonymizer = AnonymizerEngine()
 
-            logger.info("✅ Presidio analyzer initialized successfully")
+            logger.info(f"✅ Presidio analyzer initialized successfully (pool of {pool_size})")
 
         except Exception as e:
             logger.error(f"❌ Failed to initialize Presidio: {e}")
             self.presidio_analyzer = None
             self.presidio_anonymizer = None
 
+    def _build_analyzer(self, model_name: str):
+        """Create a Presidio analyzer with its own spaCy NLP engine"""
+        # Configure NLP engine with spaCy
+        configuration = {
+            "nlp_engine_name": "spacy",
+            "models": [{"lang_code": "en", "model_name": model_name}],
+        }
+
+        # Create NLP engine provider
+        provider = NlpEngineProvider(nlp_configuration=configuration)
+        nlp_engine = provider.create_engine()
+
+        # Only NER feeds PII detection; drop the parser, tagger and lemmatizer
+        nlp = nlp_engine.nlp["en"]
+        nlp.select_pipes(enable=[name for name in ("tok2vec", "ner") if name in nlp.pipe_names])
+
+        # Create recognizer registry with custom recognizers
+        registry = RecognizerRegistry()
+        registry.load_predefined_recognizers()
+
+        # Add custom recognizers
+        self._add_custom_recognizers(registry)
+
+        return AnalyzerEngine(
+            nlp_engine=nlp_engine,
+            registry=registry
+        )
+
     def _add_custom_recognizers(self, registry):
         """Add custom recognizers to Presidio"""
         try:
@@ -237,13 +374,13 @@ class PresidioSecurityDetector:
                 'description': 'Private Key'
             },
             'database_url': {
-                'pattern': r'(postgresql|mysql|mongodb)://[^:\s]+:[^@\s]+@[^:\s]+:\d+/\w+',
+                'pattern': r'(postgresql|mysql|mongodb)://[^:\s]++:[^@\s]++@[^:\s]++:\d++/\w++',
                 'confidence': 0.9,
                 'severity': DetectionLevel.CRITICAL,
                 'description': 'Database Connection URL'
             },
             'jwt_token': {
-                'pattern': r'eyJ[a-zA-Z0-9\-_]+\.[a-zA-Z0-9\-_]+\.[a-zA-Z0-9\-_]+',
+                'pattern': r'eyJ[a-zA-Z0-9\-_]++\.[a-zA-Z0-9\-_]++\.[a-zA-Z0-9\-_]++',
                 'confidence': 0.85,
                 'severity': DetectionLevel.HIGH,
                 'description': 'JWT Token'
@@ -293,38 +430,143 @@ class PresidioSecurityDetector:
             }
         }
 
-    def _compile_custom_patterns(self) -> Dict:
-        """Compile custom regex patterns for performance"""
-        compiled = {}
+    def _compile_custom_patterns(self):
+        """Compile custom regex patterns into parallel per-pattern arrays"""
+        # Possessive quantifiers in the JWT/database patterns stop backtracking on
+        # crafted input. Prefer PCRE2 with its JIT (patterns are compiled to machine
+        # code once, here at startup), then the `regex` module; stdlib `re` supports
+        # them on 3.11+.
+        if PCRE2_AVAILABLE:
+            compile_pattern = lambda pattern: pcre2.compile(
+                _spell_out_whitespace(pattern), flags=pcre2.IGNORECASE, jit=True
+            )
+        elif REGEX_AVAILABLE:
+            compile_pattern = lambda pattern: regex.compile(
+                _spell_out_whitespace(pattern), regex.IGNORECASE | regex.V1
+            )
+        else:
+            compile_pattern = lambda pattern: re.compile(pattern, re.IGNORECASE)
+
+        # Struct-of-arrays layout: index i describes the i-th pattern
+        self._pattern_names = []
+        self._pattern_regexes = []
+        self._pattern_confidences = []
+        self._pattern_severities = []
+        self._pattern_descriptions = []
+
         for name, config in self.custom_patterns.items():
-            compiled[name] = {
-                'regex': re.compile(config['pattern'], re.IGNORECASE),
-                'confidence': config['confidence'],
-                'severity': config['severity'],
-                'description': config['description']
-            }
-        return compiled
+            self._pattern_names.append(sys.intern(name))
+            self._pattern_regexes.append(compile_pattern(config['pattern']))
+            self._pattern_confidences.append(config['confidence'])
+            self._pattern_severities.append(config['severity'])
+            self._pattern_descriptions.append(sys.intern(config['description']))
+
+        self._hyperscan_db = self._compile_hyperscan_prefilter() if HYPERSCAN_AVAILABLE else None
+
+    def _compile_hyperscan_prefilter(self):
+        """Compile all custom patterns into one Hyperscan database used as a prefilter"""
+        # Hyperscan reports which patterns occur in a single pass; the per-pattern
+        # regexes then only run for those. It has no possessive quantifiers, so the
+        # greedy form is used - it matches a superset, which is safe for a prefilter.
+        expressions = [
+            config['pattern'].replace('++', '+').encode()
+            for config in self.custom_patterns.values()
+        ]
+        flags = hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SINGLEMATCH
+
+        try:
+            database = hyperscan.Database()
+            database.compile(
+                expressions=expressions,
+                ids=list(range(len(expressions))),
+                elements=len(expressions),
+                flags=[flags] * len(expressions)
+            )
+            return database
+        except Exception as e:
+            logger.warning(f"⚠️ Hyperscan prefilter disabled: {e}")
+            return None
+
+    def _candidate_patterns(self, text: str) -> range:
+        """Indices of custom patterns that may match text"""
+        # Python's \w, \d and \b are Unicode-aware; Hyperscan's match them only for
+        # ASCII, and its \s leaves out \x1c-\x1f
+        if self._hyperscan_db is None or not text.isascii() or _HYPERSCAN_NARROW_SPACE.search(text):
+            return range(len(self._pattern_names))
+
+        hits = set()
+        self._hyperscan_db.scan(
+            text.encode('ascii'),
+            match_event_handler=lambda pattern_id, start, end, flags, context: hits.add(pattern_id)
+        )
+        return sorted(hits)
 
     async def scan_content(self, text: str, context: Dict = None) -> List[SecurityIssue]:
         """
         Comprehensive security scan using Presidio + custom patterns
+
+        Pass context={"block_on_first_critical": True} to skip Presidio when the
+        custom patterns already found a CRITICAL issue (the request will be blocked).
+        If any pattern hit max_matches_per_pattern, context["truncated"] is set to True.
+        """
+        return await self.scan_content_batch([text], context)
+
+    async def scan_content_batch(self, texts: List[str], context: Dict = None) -> List[SecurityIssue]:
+        """
+        Scan several texts (e.g. chat messages) as one document
+
+        Issue locations refer to " ".join(texts). Each text goes to Presidio
+        separately so spaCy parses them in a single nlp.pipe batch.
         """
         start_time = time.time()
         self.stats['total_scans'] += 1
         issues = []
 
-        try:
-            # Presidio scan (if available)
-            if self.presidio_analyzer:
-                presidio_issues = await self._presidio_scan(text)
-                issues.extend(presidio_issues)
-                self.stats['presidio_scans'] += 1
+        # Start offset of each text within the space-joined document
+        offsets = []
+        position = 0
+        for text in texts:
+            offsets.append(position)
+            position += len(text) + 1
 
+        try:
             # Custom pattern scan (always run as backup/supplement)
-            custom_issues = await self._custom_pattern_scan(text)
+            custom_issues = []
+            for text, offset in zip(texts, offsets):
+                found, truncated = await self._custom_pattern_scan(text)
+                custom_issues.extend(self._shift_issues(found, offset))
+
+                if truncated and context is not None:
+                    context["truncated"] = True
+
             issues.extend(custom_issues)
             self.stats['custom_scans'] += 1
 
+            early_exit = bool(context) and context.get("block_on_first_critical", True)
+            blocked = early_exit and any(i.severity == DetectionLevel.CRITICAL for i in custom_issues)
+
+            # Presidio scan (if available and the request isn't already blocked)
+            if self.presidio_analyzer and not blocked:
+                scanned = []
+                budget = self.max_presidio_chars
+                for text, offset in zip(texts, offsets):
+                    clipped = len(text) > budget
+                    if clipped:
+                        text = text[:budget]
+                    if text.strip():
+                        scanned.append((text, offset))
+                        budget -= len(text)
+                    if clipped:
+                        if context is not None:
+                            context["truncated"] = True
+                        logger.info(f"✂️ Presidio input capped at {self.max_presidio_chars} chars")
+                        break
+
+                results = await asyncio.gather(*(self._presidio_scan(text) for text, _ in scanned))
+                for presidio_issues, (_, offset) in zip(results, scanned):
+                    issues.extend(self._shift_issues(presidio_issues, offset))
+                self.stats['presidio_scans'] += 1
+
             # Deduplicate overlapping issues
             issues = self._deduplicate_issues(issues)
 
@@ -338,7 +580,7 @@ class PresidioSecurityDetector:
             scan_time = time.time() - start_time
             self._update_performance_stats(scan_time)
 
-            logger.info(f"🔍 Security scan completed: {len(issues)} issues found in {scan_time:.3f}s")
+            logger.debug("🔍 Security scan completed: %d issues found in %.3fs", len(issues), scan_time)
 
             return issues
 
@@ -352,39 +594,15 @@ class PresidioSecurityDetector:
             return []
 
         try:
-            # Define entities to detect
-            entities = [
-                "CREDIT_CARD", "EMAIL_ADDRESS", "IBAN_CODE", "IP_ADDRESS",
-                "PERSON", "PHONE_NUMBER", "US_SSN", "US_PASSPORT",
-                "US_DRIVER_LICENSE", "DATE_TIME", "LOCATION", "URL",
-                "US_BANK_NUMBER", "CRYPTO", "MEDICAL_LICENSE",
-                # Custom entities
-                "API_KEY", "DATABASE_CREDENTIAL", "JWT_TOKEN"
-            ]
-
-            # Run Presidio analysis
-            results = self.presidio_analyzer.analyze(
-                text=text,
-                entities=entities,
-                language='en'
-            )
-
-            # Common false positives to filter out
-            false_positives = {
-                'you', 'i', 'me', 'we', 'they', 'he', 'she', 'it',
-                'today', 'tomorrow', 'yesterday', 'now', 'here', 'there',
-                'hello', 'hi', 'hey', 'thanks', 'please', 'yes', 'no',
-                'task', 'code', 'help', 'how', 'what', 'when', 'where', 'why',
-                'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to',
-                'for', 'with', 'by', 'from', 'about', 'into', 'through', 'during'
-            }
+            # Run Presidio analysis (batched with other in-flight scans)
+            results = await self._analyze_batched(text, PRESIDIO_ENTITIES)
 
             issues = []
             for result in results:
                 entity_text = text[result.start:result.end].lower().strip()
 
                 # Filter out common false positives
-                if result.entity_type == "PERSON" and entity_text in false_positives:
+                if result.entity_type == "PERSON" and entity_text in PERSON_FALSE_POSITIVES:
                     continue
 
                 # Filter out single character detections
@@ -403,13 +621,13 @@ class PresidioSecurityDetector:
                 severity = self._confidence_to_severity(result.score)
 
                 issue = SecurityIssue(
-                    type=result.entity_type.lower(),
+                    type=sys.intern(result.entity_type.lower()),
                     description=f"Presidio detected {result.entity_type}",
                     confidence=result.score,
                     location=(result.start, result.end),
                     severity=severity,
-                    context=text[max(0, result.start-20):result.end+20],
-                    detector="presidio",
+                    context_span=(max(0, result.start-20), result.end+20),
+                    detector=DETECTOR_PRESIDIO,
                     entity_text=entity_text
                 )
                 issues.append(issue)
@@ -421,15 +639,98 @@ class PresidioSecurityDetector:
             logger.error(f"❌ Presidio scan error: {e}")
             return []
 
-    async def _custom_pattern_scan(self, text: str) -> List[SecurityIssue]:
-        """Scan using custom regex patterns"""
+    async def _analyze_batched(self, text: str, entities: Tuple[str, ...]) -> List:
+        """Queue text for the next Presidio batch and wait for its results"""
+        future = asyncio.get_running_loop().create_future()
+        self._batch_pending.append((text, entities, future))
+
+        if self._batch_task is None or self._batch_task.done():
+            self._batch_task = asyncio.create_task(self._run_batches())
+
+        return await future
+
+    async def _run_batches(self):
+        """Drain pending scans in batches of up to max_batch_size"""
+        # Give concurrent requests a moment to join the batch
+        await asyncio.sleep(self.max_batch_wait)
+
+        while self._batch_pending:
+            batch = self._batch_pending[:self.max_batch_size]
+            del self._batch_pending[:self.max_batch_size]
+
+            # Batches run concurrently, bounded by the analyzer pool
+            run = asyncio.create_task(self._run_batch(batch))
+            self._batch_runs.add(run)
+            run.add_done_callback(self._batch_runs.discard)
+
+    async def _run_batch(self, batch: List[Tuple]):
+        """Analyze one batch off the event loop and resolve its futures"""
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self._pool, self._analyze_batch, batch
+            )
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def _analyze_batch(self, batch: List[Tuple]) -> List[List]:
+        """Run spaCy once over the batch, then Presidio recognizers per text"""
+        if self._analyzer_pool is None:
+            return self._analyze_with(self.presidio_analyzer, batch)
+
+        # Blocks this executor thread until an analyzer is free
+        analyzer = self._analyzer_pool.get()
+        try:
+            return self._analyze_with(analyzer, batch)
+        finally:
+            self._analyzer_pool.put(analyzer)
+
+    @staticmethod
+    def _analyze_with(analyzer, batch: List[Tuple]) -> List[List]:
+        """Analyze a batch with the given Presidio analyzer"""
+        texts = [text for text, _, _ in batch]
+        processed = analyzer.nlp_engine.process_batch(
+            texts,
+            language='en',
+            batch_size=len(texts)
+        )
+
+        return [
+            analyzer.analyze(
+                text=text,
+                entities=entities,
+                language='en',
+                nlp_artifacts=nlp_artifacts
+            )
+            for (text, nlp_artifacts), (_, entities, _) in zip(processed, batch)
+        ]
+
+    async def _custom_pattern_scan(self, text: str) -> Tuple[List[SecurityIssue], bool]:
+        """Scan using custom regex patterns, returning issues and whether any pattern was capped"""
         issues = []
+        truncated = False
+
+        for index in self._candidate_patterns(text):
+            pattern_name = self._pattern_names[index]
+            regex = self._pattern_regexes[index]
+            confidence = self._pattern_confidences[index]
+            severity = self._pattern_severities[index]
+            description = self._pattern_descriptions[index]
 
-        for pattern_name, config in self.compiled_patterns.items():
             try:
-                matches = config['regex'].finditer(text)
+                matches = regex.finditer(text)
+
+                for count, match in enumerate(matches):
+                    if count >= self.max_matches_per_pattern:
+                        truncated = True
+                        break
 
-                for match in matches:
                     # Additional validation for specific patterns
                     if pattern_name == "credit_card" and not self._validate_luhn(match.group()):
                         continue
@@ -439,12 +740,12 @@ class PresidioSecurityDetector:
 
                     issue = SecurityIssue(
                         type=pattern_name,
-                        description=config['description'],
-                        confidence=config['confidence'],
+                        description=description,
+                        confidence=confidence,
                         location=(match.start(), match.end()),
-                        severity=config['severity'],
-                        context=text[max(0, match.start()-20):match.end()+20],
-                        detector="custom_regex",
+                        severity=severity,
+                        context_span=(max(0, match.start()-20), match.end()+20),
+                        detector=DETECTOR_CUSTOM_REGEX,
                         entity_text=match.group()
                     )
                     issues.append(issue)
@@ -453,7 +754,22 @@ class PresidioSecurityDetector:
                 logger.error(f"❌ Error in custom pattern {pattern_name}: {e}")
 
         logger.debug(f"🔍 Custom patterns found {len(issues)} issues")
-        return issues
+        return issues, truncated
+
+    @staticmethod
+    def _shift_issues(issues: List[SecurityIssue], offset: int) -> List[SecurityIssue]:
+        """Move issue locations from a single text into the joined document"""
+        if not offset:
+            return issues
+
+        return [
+            replace(
+                issue,
+                location=(issue.location[0] + offset, issue.location[1] + offset),
+                context_span=(issue.context_span[0] + offset, issue.context_span[1] + offset)
+            )
+            for issue in issues
+        ]
 
     def _deduplicate_issues(self, issues: List[SecurityIssue]) -> List[SecurityIssue]:
         """Remove overlapping issues, keeping highest confidence"""
@@ -486,14 +802,7 @@ class PresidioSecurityDetector:
 
     def _confidence_to_severity(self, confidence: float) -> DetectionLevel:
         """Convert confidence score to severity level"""
-        if confidence >= DetectionLevel.CRITICAL.value:
-            return DetectionLevel.CRITICAL
-        elif confidence >= DetectionLevel.HIGH.value:
-            return DetectionLevel.HIGH
-        elif confidence >= DetectionLevel.MEDIUM.value:
-            return DetectionLevel.MEDIUM
-        else:
-            return DetectionLevel.LOW
+        return _SEVERITY_LEVELS[bisect.bisect_right(_SEVERITY_THRESHOLDS, confidence)]
 
     def should_block_request(self, issues: List[SecurityIssue]) -> bool:
         """Determine if request should be blocked with very conservative thresholds"""
@@ -503,7 +812,6 @@ class PresidioSecurityDetector:
         # Only block on CRITICAL issues (API keys, private keys, database credentials)
         critical_issues = [i for i in issues if i.severity == DetectionLevel.CRITICAL]
         if critical_issues:
-            self.stats['blocked_requests'] += 1
             return True
 
         # Block on extremely high confidence HIGH severity issues (real SSN, validated credit cards)
@@ -513,7 +821,6 @@ class PresidioSecurityDetector:
             for issue in extremely_high_confidence:
                 entity_text = issue.entity_text.lower().strip()
                 if len(entity_text) > 3 and entity_text not in {'task', 'code', 'help', 'hello', 'thanks'}:
-                    self.stats['blocked_requests'] += 1
                     return True
 
         # Allow everything else - be very permissive for normal conversation
@@ -606,8 +913,14 @@ class PresidioSecurityDetector:
         new_avg = ((current_avg * (total_scans - 1)) + scan_time) / total_scans
         self.stats['avg_scan_time'] = new_avg
 
-    def get_detection_summary(self, issues: List[SecurityIssue]) -> Dict:
-        """Generate comprehensive detection summary"""
+    def _summary_context(self, text: str, issue: SecurityIssue) -> str:
+        """Slice an issue's context from the scanned text, truncated for the summary"""
+        start, end = issue.context_span
+        context = text[start:min(end, start + 51)]
+        return context[:50] + "..." if len(context) > 50 else context
+
+    def get_detection_summary(self, issues: List[SecurityIssue], text: str = "", truncated: bool = False) -> Dict:
+        """Generate comprehensive detection summary for issues found in text"""
         if not issues:
             return {"clean": True, "issues": []}
 
@@ -621,12 +934,13 @@ class PresidioSecurityDetector:
                 "low": len([i for i in issues if i.severity == DetectionLevel.LOW])
             },
             "detector_breakdown": {
-                "presidio": len([i for i in issues if i.detector == "presidio"]),
-                "custom_regex": len([i for i in issues if i.detector == "custom_regex"])
+                "presidio": len([i for i in issues if i.detector == DETECTOR_PRESIDIO]),
+                "custom_regex": len([i for i in issues if i.detector == DETECTOR_CUSTOM_REGEX])
             },
             "issue_types": list(set(issue.type for issue in issues)),
             "max_confidence": max(issue.confidence for issue in issues),
             "should_block": self.should_block_request(issues),
+            "truncated": truncated,
             "issues": [
                 {
                     "type": issue.type,
@@ -635,7 +949,7 @@ class PresidioSecurityDetector:
                     "severity": issue.severity.name,
                     "detector": issue.detector,
                     "entity_text": issue.entity_text[:20] + "..." if len(issue.entity_text) > 20 else issue.entity_text,
-                    "context": issue.context[:50] + "..." if len(issue.context) > 50 else issue.context
+                    "context": self._summary_context(text, issue)
                 }
                 for issue in issues
             ]
@@ -655,62 +969,159 @@ class PresidioSecurityDetector:
         return stats
 
 
-class PresidioGatewayHandler(http.server.BaseHTTPRequestHandler):
-    """HTTP handler with Microsoft Presidio integration"""
+# Landing page with the import-time feature flags resolved; only the Presidio
+# status and the six detection counters are %-formatted per request
+WELCOME_TEMPLATE = f"""
+        <html>
+        <head><title>Microsoft Presidio-Enhanced LLM Gateway</title></head>
+        <body style="font-family: Arial; max-width: 1000px; margin: 50px auto; padding: 20px;">
+            <h1>Microsoft Presidio-Enhanced LLM Gateway</h1>
+            <p><strong>Status:</strong> Running on Railway with Enterprise ML Security</p>
+            <p><strong>Version:</strong> 3.0.0-presidio</p>
+            <p><strong>Presidio Status:</strong> %s</p>
+
+            <h2>Microsoft Presidio Integration</h2>
+            <div style="background: #f5f5f5; padding: 15px; border-radius: 5px; margin: 20px 0;">
+                <h3>🧠 ML-Powered Detection</h3>
+                <ul>
+                    <li><strong>Presidio Available:</strong> {'✅ Yes' if PRESIDIO_AVAILABLE else '❌ No (using fallback)'}</li>
+                    <li><strong>spaCy NLP:</strong> {'✅ Active' if SPACY_AVAILABLE else '❌ Not available'}</li>
+                    <li><strong>Detection Mode:</strong> {'Hybrid (Presidio + Custom)' if PRESIDIO_AVAILABLE else 'Custom Patterns Only'}</li>
+                    <li><strong>Entity Recognition:</strong> {'50+ ML entities' if PRESIDIO_AVAILABLE else '15+ regex patterns'}</li>
+                </ul>
+            </div>
+
+            <h2>Enterprise Security Features</h2>
+            <div style="display: grid; grid-template-columns: 1fr 1fr; gap: 20px;">
+                <div>
+                    <h3>🔍 Detection Capabilities</h3>
+                    <ul>
+                        <li><strong>PII Detection:</strong> Names, emails, phones, addresses</li>
+                        <li><strong>Financial Data:</strong> Credit cards, bank numbers, IBAN</li>
+                        <li><strong>Government IDs:</strong> SSN, passports, driver licenses</li>
+                        <li><strong>API Keys:</strong> OpenAI, Anthropic, GitHub, AWS, Google</li>
+                        <li><strong>Database Credentials:</strong> Connection strings, URLs</li>
+                        <li><strong>Authentication:</strong> JWT tokens, private keys</li>
+                        <li><strong>Medical Info:</strong> License numbers, patient data</li>
+                        <li><strong>Network Data:</strong> IP addresses, URLs</li>
+                    </ul>
+                </div>
+                <div>
+                    <h3>🚀 Advanced Features</h3>
+                    <ul>
+                        <li><strong>ML Analysis:</strong> Context-aware entity recognition</li>
+                        <li><strong>Confidence Scoring:</strong> 0.0 - 1.0 precision</li>
+                        <li><strong>Severity Classification:</strong> LOW, MEDIUM, HIGH, CRITICAL</li>
+                        <li><strong>Smart Validation:</strong> Luhn algorithm, format checking</li>
+                        <li><strong>Overlap Detection:</strong> Deduplication logic</li>
+                        <li><strong>Hybrid Approach:</strong> Presidio + custom patterns</li>
+                        <li><strong>Performance Tracking:</strong> Scan time, accuracy metrics</li>
+                        <li><strong>Graceful Fallback:</strong> Works without ML dependencies</li>
+                    </ul>
+                </div>
+            </div>
+
+            <h2>Detection Statistics</h2>
+            <div style="background: #e8f4fd; padding: 15px; border-radius: 5px;">
+                <p><strong>Total Scans:</strong> %d</p>
+                <p><strong>Presidio Scans:</strong> %d</p>
+                <p><strong>Custom Pattern Scans:</strong> %d</p>
+                <p><strong>Issues Found:</strong> %d</p>
+                <p><strong>Requests Blocked:</strong> %d</p>
+                <p><strong>Average Scan Time:</strong> %sms</p>
+            </div>
+
+            <h2>API Endpoints</h2>
+            <ul>
+                <li><code>GET /health</code> - Comprehensive health check with Presidio status</li>
+                <li><code>GET /stats</code> - Detailed detection statistics</li>
+                <li><code>GET /presidio-status</code> - Presidio-specific status information</li>
+                <li><code>POST /v1/chat/completions</code> - Secure chat completions with ML detection</li>
+            </ul>
+
+            <h2>Test Commands</h2>
+            <h3>Health Check:</h3>
+            <pre>curl https://genai-gateway-production.up.railway.app/health</pre>
+
+            <h3>Presidio Status:</h3>
+            <pre>curl https://genai-gateway-production.up.railway.app/presidio-status</pre>
+
+            <h3>Normal Request:</h3>
+            <pre>curl -X POST https://genai-gateway-production.up.railway.app/v1/chat/completions \\
+  -H "Content-Type: application/json" \\
+  -d '{{"messages": [{{"role": "user", "content": "Hello, how are you today?"}}]}}'</pre>
+
+            <h3>PII Detection Test:</h3>
+            <pre>curl -X POST https://genai-gateway-production.up.railway.app/v1/chat/completions \\
+  -H "Content-Type: application/json" \\
+  -d '{{"messages": [{{"role": "user", "content": "My name is John Doe and my email is john.doe@example.com"}}]}}'</pre>
+
+            <h3>API Key Detection Test (Will Block):</h3>
+            <pre>curl -X POST https://genai-gateway-production.up.railway.app/v1/chat/completions \\
+  -H "Content-Type: application/json" \\
+  -d '{{"messages": [{{"role": "user", "content": "My OpenAI key is sk-1234567890abcdef1234567890abcdef12345678"}}]}}'</pre>
+
+            <p><em>Microsoft Presidio-Enhanced LLM Gateway - Enterprise ML Security</em></p>
+        </body>
+        </html>
+        """.encode()
+
+_WELCOME_PRESIDIO_ACTIVE = "✅ Active".encode()
+_WELCOME_PRESIDIO_FALLBACK = "❌ Fallback Mode".encode()
+
+# Server-sent event framing, pre-encoded for the streaming paths
+_SSE_PREFIX = b"data: "
+_SSE_SUFFIX = b"\n\n"
+_SSE_DONE = b"data: [DONE]\n\n"
+
+
+class PresidioGatewayHandler:
+    """aiohttp request handlers with Microsoft Presidio integration"""
 
-    # Class-level detector instance
+    # Class-level detector and keep-alive DeepSeek client shared by all requests
     detector = None
+    http_session = None
+
+    # LRU of recent scan results keyed by content digest; chats resend the same history
+    scan_cache: "OrderedDict[bytes, Tuple[List[SecurityIssue], Dict[str, Any], bool]]" = OrderedDict()
+    scan_cache_size = 1024
+
+    # Shorter text can't hold any custom pattern or meaningful entity; skip the scan
+    min_scan_length = 4
+
+    _init_lock = asyncio.Lock()
 
     @classmethod
     async def initialize_detector(cls):
         """Initialize the detector once for all requests"""
-        if cls.detector is None:
-            cls.detector = PresidioSecurityDetector()
-            await cls.detector.initialize()
-
-    def do_GET(self):
-        """Handle GET requests"""
-        if self.path == '/health':
-            self.send_health()
-        elif self.path == '/stats':
-            self.send_stats()
-        elif self.path == '/presidio-status':
-            self.send_presidio_status()
-        elif self.path == '/v1/models':
-            self.send_models()
-        elif self.path == '/':
-            self.send_welcome()
-        else:
-            self.send_error(404)
-
-    def do_POST(self):
-        """Handle POST requests"""
-        if self.path == '/v1/chat/completions':
-            try:
-                # Run async handler in sync context with proper error handling
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                try:
-                    loop.run_until_complete(self.handle_chat_async())
-                finally:
-                    loop.close()
-            except Exception as e:
-                print(f"Error in chat handler: {e}")
-                import traceback
-                traceback.print_exc()
-                self.send_error(500, f"Internal server error: {str(e)}")
-        else:
-            self.send_error(404)
+        if cls.detector is not None:
+            return
+
+        # Publish the detector only once it is fully initialized, so concurrent
+        # first requests wait here instead of scanning without Presidio
+        async with cls._init_lock:
+            if cls.detector is None:
+                detector = PresidioSecurityDetector()
+                await detector.initialize()
+                cls.detector = detector
+
+    async def handle_chat(self, request: web.Request) -> web.StreamResponse:
+        """Handle POST /v1/chat/completions"""
+        try:
+            return await self.handle_chat_async(request)
+        except Exception as e:
+            logger.exception(f"❌ Error in chat handler: {e}")
+            return self.send_error(500, f"Internal server error: {str(e)}")
 
-    def do_OPTIONS(self):
+    async def handle_options(self, request: web.Request) -> web.Response:
         """Handle CORS preflight"""
-        self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.end_headers()
+        return web.Response(headers={
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+            'Access-Control-Allow-Headers': 'Content-Type'
+        })
 
-    def send_health(self):
+    async def send_health(self, request: web.Request) -> web.Response:
         """Enhanced health response with Presidio status"""
         stats = self.detector.get_stats() if self.detector else {}
 
@@ -748,14 +1159,14 @@ class PresidioGatewayHandler(http.server.BaseHTTPRequestHandler):
             ],
             "statistics": stats
         }
-        self.send_json(response)
+        return self.send_json(response)
 
-    def send_stats(self):
+    async def send_stats(self, request: web.Request) -> web.Response:
         """Send detailed detection statistics"""
         stats = self.detector.get_stats() if self.detector else {}
-        self.send_json(stats)
+        return self.send_json(stats)
 
-    def send_presidio_status(self):
+    async def send_presidio_status(self, request: web.Request) -> web.Response:
         """Send Presidio-specific status information"""
         status = {
             "presidio_available": PRESIDIO_AVAILABLE,
@@ -768,9 +1179,9 @@ class PresidioGatewayHandler(http.server.BaseHTTPRequestHandler):
             "fallback_mode": not PRESIDIO_AVAILABLE,
             "custom_patterns_count": len(self.detector.custom_patterns) if self.detector else 0
         }
-        self.send_json(status)
+        return self.send_json(status)
 
-    def send_models(self):
+    async def send_models(self, request: web.Request) -> web.Response:
         """Send available models list (OpenAI API compatible)"""
         # Check if we have DeepSeek configured
         deepseek_key = os.getenv('DEEPSEEK_API_KEY')
@@ -830,198 +1241,98 @@ class PresidioGatewayHandler(http.server.BaseHTTPRequestHandler):
             "api_key_detection": True
         }
 
-        self.send_json(models)
+        return self.send_json(models)
 
-    def send_welcome(self):
+    async def send_welcome(self, request: web.Request) -> web.Response:
         """Enhanced welcome page with Presidio information"""
         stats = self.detector.get_stats() if self.detector else {}
-        presidio_status = "✅ Active" if PRESIDIO_AVAILABLE and self.detector and self.detector.presidio_analyzer else "❌ Fallback Mode"
-
-        html = f"""
-        <html>
-        <head><title>Microsoft Presidio-Enhanced LLM Gateway</title></head>
-        <body style="font-family: Arial; max-width: 1000px; margin: 50px auto; padding: 20px;">
-            <h1>Microsoft Presidio-Enhanced LLM Gateway</h1>
-            <p><strong>Status:</strong> Running on Railway with Enterprise ML Security</p>
-            <p><strong>Version:</strong> 3.0.0-presidio</p>
-            <p><strong>Presidio Status:</strong> {presidio_status}</p>
-
-            <h2>Microsoft Presidio Integration</h2>
-            <div style="background: #f5f5f5; padding: 15px; border-radius: 5px; margin: 20px 0;">
-                <h3>🧠 ML-Powered Detection</h3>
-                <ul>
-                    <li><strong>Presidio Available:</strong> {'✅ Yes' if PRESIDIO_AVAILABLE else '❌ No (using fallback)'}</li>
-                    <li><strong>spaCy NLP:</strong> {'✅ Active' if SPACY_AVAILABLE else '❌ Not available'}</li>
-                    <li><strong>Detection Mode:</strong> {'Hybrid (Presidio + Custom)' if PRESIDIO_AVAILABLE else 'Custom Patterns Only'}</li>
-                    <li><strong>Entity Recognition:</strong> {'50+ ML entities' if PRESIDIO_AVAILABLE else '15+ regex patterns'}</li>
-                </ul>
-            </div>
-
-            <h2>Enterprise Security Features</h2>
-            <div style="display: grid; grid-template-columns: 1fr 1fr; gap: 20px;">
-                <div>
-                    <h3>🔍 Detection Capabilities</h3>
-                    <ul>
-                        <li><strong>PII Detection:</strong> Names, emails, phones, addresses</li>
-                        <li><strong>Financial Data:</strong> Credit cards, bank numbers, IBAN</li>
-                        <li><strong>Government IDs:</strong> SSN, passports, driver licenses</li>
-                        <li><strong>API Keys:</strong> OpenAI, Anthropic, GitHub, AWS, Google</li>
-                        <li><strong>Database Credentials:</strong> Connection strings, URLs</li>
-                        <li><strong>Authentication:</strong> JWT tokens, private keys</li>
-                        <li><strong>Medical Info:</strong> License numbers, patient data</li>
-                        <li><strong>Network Data:</strong> IP addresses, URLs</li>
-                    </ul>
-                </div>
-                <div>
-                    <h3>🚀 Advanced Features</h3>
-                    <ul>
-                        <li><strong>ML Analysis:</strong> Context-aware entity recognition</li>
-                        <li><strong>Confidence Scoring:</strong> 0.0 - 1.0 precision</li>
-                        <li><strong>Severity Classification:</strong> LOW, MEDIUM, HIGH, CRITICAL</li>
-                        <li><strong>Smart Validation:</strong> Luhn algorithm, format checking</li>
-                        <li><strong>Overlap Detection:</strong> Deduplication logic</li>
-                        <li><strong>Hybrid Approach:</strong> Presidio + custom patterns</li>
-                        <li><strong>Performance Tracking:</strong> Scan time, accuracy metrics</li>
-                        <li><strong>Graceful Fallback:</strong> Works without ML dependencies</li>
-                    </ul>
-                </div>
-            </div>
-
-            <h2>Detection Statistics</h2>
-            <div style="background: #e8f4fd; padding: 15px; border-radius: 5px;">
-                <p><strong>Total Scans:</strong> {stats.get('total_scans', 0)}</p>
-                <p><strong>Presidio Scans:</strong> {stats.get('presidio_scans', 0)}</p>
-                <p><strong>Custom Pattern Scans:</strong> {stats.get('custom_scans', 0)}</p>
-                <p><strong>Issues Found:</strong> {stats.get('issues_found', 0)}</p>
-                <p><strong>Requests Blocked:</strong> {stats.get('blocked_requests', 0)}</p>
-                <p><strong>Average Scan Time:</strong> {stats.get('avg_scan_time_ms', 0)}ms</p>
-            </div>
-
-            <h2>API Endpoints</h2>
-            <ul>
-                <li><code>GET /health</code> - Comprehensive health check with Presidio status</li>
-                <li><code>GET /stats</code> - Detailed detection statistics</li>
-                <li><code>GET /presidio-status</code> - Presidio-specific status information</li>
-                <li><code>POST /v1/chat/completions</code> - Secure chat completions with ML detection</li>
-            </ul>
-
-            <h2>Test Commands</h2>
-            <h3>Health Check:</h3>
-            <pre>curl https://genai-gateway-production.up.railway.app/health</pre>
-
-            <h3>Presidio Status:</h3>
-            <pre>curl https://genai-gateway-production.up.railway.app/presidio-status</pre>
-
-            <h3>Normal Request:</h3>
-            <pre>curl -X POST https://genai-gateway-production.up.railway.app/v1/chat/completions \\
-  -H "Content-Type: application/json" \\
-  -d '{{"messages": [{{"role": "user", "content": "Hello, how are you today?"}}]}}'</pre>
-
-            <h3>PII Detection Test:</h3>
-            <pre>curl -X POST https://genai-gateway-production.up.railway.app/v1/chat/completions \\
-  -H "Content-Type: application/json" \\
-  -d '{{"messages": [{{"role": "user", "content": "My name is John Doe and my email is john.doe@example.com"}}]}}'</pre>
-
-            <h3>API Key Detection Test (Will Block):</h3>
-            <pre>curl -X POST https://genai-gateway-production.up.railway.app/v1/chat/completions \\
-  -H "Content-Type: application/json" \\
-  -d '{{"messages": [{{"role": "user", "content": "My OpenAI key is sk-1234567890abcdef1234567890abcdef12345678"}}]}}'</pre>
-
-            <p><em>Microsoft Presidio-Enhanced LLM Gateway - Enterprise ML Security</em></p>
-        </body>
-        </html>
-        """
-        self.send_response(200)
-        self.send_header('Content-Type', 'text/html')
-        self.end_headers()
-        self.wfile.write(html.encode())
+        presidio_active = PRESIDIO_AVAILABLE and self.detector and self.detector.presidio_analyzer
+        presidio_status = _WELCOME_PRESIDIO_ACTIVE if presidio_active else _WELCOME_PRESIDIO_FALLBACK
+
+        html = WELCOME_TEMPLATE % (
+            presidio_status,
+            stats.get('total_scans', 0),
+            stats.get('presidio_scans', 0),
+            stats.get('custom_scans', 0),
+            stats.get('issues_found', 0),
+            stats.get('blocked_requests', 0),
+            str(stats.get('avg_scan_time_ms', 0)).encode()
+        )
+        return web.Response(body=html, content_type='text/html', charset='utf-8')
 
-    async def handle_chat_async(self):
+    async def handle_chat_async(self, request: web.Request) -> web.StreamResponse:
         """Enhanced async chat handling with Presidio detection"""
         request_id = uuid.uuid4().hex[:8]
 
         try:
-            # Log request details for debugging
-            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] Request {request_id} from {self.headers.get('User-Agent', 'Unknown')}")
-            print(f"  Headers: {dict(self.headers)}")
+            debug = logger.isEnabledFor(logging.DEBUG)
+            if debug:
+                logger.debug("Request %s from %s headers=%r", request_id,
+                             request.headers.get('User-Agent', 'Unknown'), dict(request.headers))
 
-            content_length = int(self.headers.get('Content-Length', 0))
-            if content_length == 0:
-                print(f"  ERROR: No content length")
-                self.send_error(400, "No content")
-                return
+            if not request.body_exists:
+                return self.send_error(400, "No content")
+            if (request.content_length or 0) > MAX_BODY_BYTES:
+                return self.send_error(413, "Request body too large")
 
-            print(f"  Content-Length: {content_length}")
-
-            post_data = self.rfile.read(content_length)
-            print(f"  Raw data length: {len(post_data)}")
-            print(f"  Raw data preview: {post_data[:200]}...")
+            # Chunked bodies have no Content-Length; client_max_size caps them while reading
+            try:
+                post_data = await request.read()
+            except web.HTTPRequestEntityTooLarge:
+                return self.send_error(413, "Request body too large")
 
             try:
-                request_data = json.loads(post_data.decode('utf-8'))
-                print(f"  Parsed JSON successfully")
-            except json.JSONDecodeError as e:
-                print(f"  JSON decode error: {e}")
-                print(f"  Raw data: {post_data}")
-                self.send_error(400, f"Invalid JSON: {str(e)}")
-                return
+                request_data = orjson.loads(post_data)
+            except orjson.JSONDecodeError as e:
+                if debug:
+                    logger.debug("Request %s JSON decode error: %s", request_id, e)
+                return self.send_error(400, f"Invalid JSON: {str(e)}")
 
             # Extract text content with type safety
-            text_content = ""
+            text_parts = []
             messages = request_data.get('messages', [])
-            print(f"  Processing {len(messages)} messages")
 
-            for i, msg in enumerate(messages):
+            for msg in messages:
                 content = msg.get('content', '')
-                print(f"    Message {i}: type={type(content)}, content={repr(content)[:100]}")
 
                 # Handle different content types
                 if isinstance(content, str):
-                    text_content += content + " "
+                    text_parts.append(content)
                 elif isinstance(content, list):
                     # Handle list of content parts (multimodal)
                     for part in content:
                         if isinstance(part, dict) and 'text' in part:
-                            text_content += part['text'] + " "
+                            text_parts.append(part['text'])
                         elif isinstance(part, str):
-                            text_content += part + " "
+                            text_parts.append(part)
                 else:
                     # Convert to string as fallback
-                    text_content += str(content) + " "
+                    text_parts.append(str(content))
 
-            print(f"  Final text_content: {repr(text_content[:200])}...")
+            text_content = " ".join(text_parts)
 
             # Enhanced security scan with Presidio
             if not self.detector:
-                print(f"  Initializing detector...")
                 await self.initialize_detector()
 
-            print(f"  Running security scan...")
             try:
-                issues = await self.detector.scan_content(text_content)
-                detection_summary = self.detector.get_detection_summary(issues)
-                print(f"  Security scan completed: {len(issues)} issues found")
+                issues, detection_summary, should_block = await self._scan_cached(text_parts, text_content)
             except Exception as scan_error:
-                print(f"  Security scan error: {scan_error}")
-                import traceback
-                traceback.print_exc()
+                logger.exception(f"❌ Security scan error: {scan_error}")
                 # Continue with empty issues if scan fails
                 issues = []
                 detection_summary = {"clean": True, "issues": []}
+                should_block = False
 
-            # Detailed logging
-            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] Presidio Request {request_id}")
-            print(f"  Content length: {len(text_content)} chars")
-            print(f"  Issues detected: {len(issues)}")
-            print(f"  Presidio active: {self.detector.presidio_analyzer is not None}")
-
-            for issue in issues:
-                print(f"    - {issue.type}: {issue.severity.name} (confidence: {issue.confidence:.3f}) [{issue.detector}]")
+            if debug:
+                logger.debug("Request %s: %d messages, %d chars, presidio=%s, issues=%s",
+                             request_id, len(messages), len(text_content),
+                             self.detector.presidio_analyzer is not None,
+                             [(i.type, i.severity.name, round(i.confidence, 3), i.detector) for i in issues])
 
             # Determine blocking
-            should_block = self.detector.should_block_request(issues)
-
             if should_block:
+                self.detector.stats['blocked_requests'] += 1
                 error_response = {
                     "error": "Request blocked due to security policy violations",
                     "blocked": True,
@@ -1030,13 +1341,11 @@ class PresidioGatewayHandler(http.server.BaseHTTPRequestHandler):
                     "detection_engine": "Microsoft Presidio + Custom Patterns",
                     "detection_summary": detection_summary
                 }
-                print(f"  BLOCKED: {len(issues)} security violations detected")
-                self.send_json(error_response, 400)
-                return
+                logger.info("🚫 Request %s blocked: %d security violations detected", request_id, len(issues))
+                return self.send_json(error_response, 400)
 
             # Check if streaming is requested
             is_streaming = request_data.get('stream', False)
-            print(f"  Streaming requested: {is_streaming}")
 
             # Check if DeepSeek API key is configured
             deepseek_key = os.getenv('DEEPSEEK_API_KEY')
@@ -1045,45 +1354,62 @@ class PresidioGatewayHandler(http.server.BaseHTTPRequestHandler):
                 # Forward to DeepSeek API
                 try:
                     if is_streaming:
-                        await self._forward_to_deepseek_streaming(request_data, deepseek_key, detection_summary, len(issues))
-                        print(f"  SUCCESS: Streaming DeepSeek response with {len(issues)} low-risk issues")
+                        return await self._forward_to_deepseek_streaming(request, request_data, deepseek_key, detection_summary, len(issues))
                     else:
                         response = await self._forward_to_deepseek(request_data, deepseek_key, detection_summary, len(issues))
-                        print(f"  SUCCESS: Real DeepSeek response with {len(issues)} low-risk issues")
-                        self.send_json(response)
+                        return self.send_json(response)
                 except Exception as e:
-                    print(f"  DeepSeek API Error: {e}")
-                    import traceback
-                    traceback.print_exc()
+                    logger.warning(f"⚠️ DeepSeek API error, falling back to mock response: {e}")
                     # Fall back to mock response if DeepSeek fails
                     if is_streaming:
-                        self._send_mock_streaming_response(request_id, messages, issues, detection_summary)
-                        print(f"  FALLBACK: Mock streaming response due to DeepSeek error")
+                        return await self._send_mock_streaming_response(request, request_id, messages, issues, detection_summary)
                     else:
                         response = self._create_mock_response(request_id, messages, issues, detection_summary)
-                        print(f"  FALLBACK: Mock response due to DeepSeek error")
-                        self.send_json(response)
+                        return self.send_json(response)
             else:
                 # Mock response when no API key
                 if is_streaming:
-                    self._send_mock_streaming_response(request_id, messages, issues, detection_summary)
-                    print(f"  MOCK: Streaming mock response (no DeepSeek API key)")
+                    return await self._send_mock_streaming_response(request, request_id, messages, issues, detection_summary)
                 else:
                     response = self._create_mock_response(request_id, messages, issues, detection_summary)
-                    print(f"  MOCK: No DeepSeek API key configured")
-                    self.send_json(response)
+                    return self.send_json(response)
 
-        except json.JSONDecodeError:
-            self.send_error(400, "Invalid JSON")
+        except orjson.JSONDecodeError:
+            return self.send_error(400, "Invalid JSON")
         except Exception as e:
-            print(f"  ERROR: {e}")
-            self.send_error(500, str(e))
+            logger.error(f"❌ Request {request_id} failed: {e}")
+            return self.send_error(500, str(e))
+
+    async def _scan_cached(self, text_parts: List[str], text_content: str) -> Tuple[List[SecurityIssue], Dict[str, Any], bool]:
+        """Scan message parts, returning issues, summary and blocking decision
+
+        Results for text seen recently are served from the LRU cache.
+        """
+        if len(text_content.strip()) < self.min_scan_length:
+            return [], {"clean": True, "issues": []}, False
+
+        key = hashlib.blake2b(text_content.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+        cache = self.scan_cache
+        cached = cache.get(key)
+        if cached is not None:
+            cache.move_to_end(key)
+            return cached
+
+        scan_context = {"block_on_first_critical": True}
+        issues = await self.detector.scan_content_batch(text_parts, scan_context)
+        detection_summary = self.detector.get_detection_summary(
+            issues, text_content, truncated=scan_context.get("truncated", False)
+        )
+
+        # The summary already ran should_block_request; reuse its verdict
+        result = (issues, detection_summary, detection_summary.get("should_block", False))
+        cache[key] = result
+        if len(cache) > self.scan_cache_size:
+            cache.popitem(last=False)
+        return result
 
     async def _forward_to_deepseek(self, request_data, api_key, detection_summary, issues_count):
         """Forward request to DeepSeek API"""
-        import urllib.request
-        import urllib.parse
-
         # DeepSeek API endpoint
         url = "https://api.deepseek.com/v1/chat/completions"
 
@@ -1103,16 +1429,11 @@ class PresidioGatewayHandler(http.server.BaseHTTPRequestHandler):
             "stream": False  # Force non-streaming for simplicity
         }
 
-        # Make request to DeepSeek
-        req = urllib.request.Request(
-            url,
-            data=json.dumps(deepseek_request).encode('utf-8'),
-            headers=headers
-        )
-
         try:
-            with urllib.request.urlopen(req, timeout=30) as response:
-                deepseek_response = json.loads(response.read().decode('utf-8'))
+            # Make request to DeepSeek over the pooled session
+            async with self.http_session.post(url, json=deepseek_request, headers=headers) as response:
+                response.raise_for_status()
+                deepseek_response = await response.json(loads=orjson.loads)
 
             # Add security scan information to response
             deepseek_response["security_scan"] = {
@@ -1129,10 +1450,8 @@ class PresidioGatewayHandler(http.server.BaseHTTPRequestHandler):
         except Exception as e:
             raise Exception(f"DeepSeek API request failed: {str(e)}")
 
-    async def _forward_to_deepseek_streaming(self, request_data, api_key, detection_summary, issues_count):
+    async def _forward_to_deepseek_streaming(self, request, request_data, api_key, detection_summary, issues_count):
         """Forward streaming request to DeepSeek API"""
-        import urllib.request
-
         # DeepSeek API endpoint
         url = "https://api.deepseek.com/v1/chat/completions"
 
@@ -1152,21 +1471,16 @@ class PresidioGatewayHandler(http.server.BaseHTTPRequestHandler):
             "stream": True
         }
 
-        # Make streaming request to DeepSeek
-        req = urllib.request.Request(
-            url,
-            data=json.dumps(deepseek_request).encode('utf-8'),
-            headers=headers
-        )
+        stream = web.StreamResponse(headers={
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-cache',
+            'Connection': 'keep-alive',
+            'Access-Control-Allow-Origin': '*'
+        })
 
         try:
             # Set up SSE response headers
-            self.send_response(200)
-            self.send_header('Content-Type', 'text/event-stream')
-            self.send_header('Cache-Control', 'no-cache')
-            self.send_header('Connection', 'keep-alive')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
+            await stream.prepare(request)
 
             # Send security scan info as first event
             security_event = {
@@ -1185,43 +1499,49 @@ class PresidioGatewayHandler(http.server.BaseHTTPRequestHandler):
                 "security_scan": detection_summary
             }
 
-            self.wfile.write(f"data: {json.dumps(security_event)}\n\n".encode())
-            self.wfile.flush()
+            await stream.write(_SSE_PREFIX + orjson.dumps(security_event) + _SSE_SUFFIX)
 
             # Forward streaming response from DeepSeek
-            with urllib.request.urlopen(req, timeout=30) as response:
-                for line in response:
-                    line = line.decode('utf-8').strip()
-                    if line.startswith('data: '):
-                        # Forward the streaming data
-                        self.wfile.write(f"{line}\n\n".encode())
-                        self.wfile.flush()
+            async with self.http_session.post(url, json=deepseek_request, headers=headers) as response:
+                response.raise_for_status()
+                # Upstream events are already SSE-framed bytes; forward them undecoded
+                async for line in response.content:
+                    if line.startswith(_SSE_PREFIX):
+                        line = line.rstrip()
+                        await stream.write(line + _SSE_SUFFIX)
 
                         # Check for end of stream
-                        if line == 'data: [DONE]':
+                        if line == b"data: [DONE]":
                             break
 
         except Exception as e:
+            # Headers not sent yet, let the caller fall back to a mock stream
+            if not stream.prepared:
+                raise
+
             # Send error as SSE event
+            logger.error(f"❌ DeepSeek streaming error: {e}")
             error_event = {
                 "error": f"DeepSeek streaming failed: {str(e)}",
                 "type": "error"
             }
-            self.wfile.write(f"data: {json.dumps(error_event)}\n\n".encode())
-            self.wfile.write(b"data: [DONE]\n\n")
-            self.wfile.flush()
-            raise
+            await stream.write(_SSE_PREFIX + orjson.dumps(error_event) + _SSE_SUFFIX)
+            await stream.write(_SSE_DONE)
+
+        return stream
 
-    def _send_mock_streaming_response(self, request_id, messages, issues, detection_summary):
+    async def _send_mock_streaming_response(self, request, request_id, messages, issues, detection_summary):
         """Send mock streaming response when DeepSeek is not available"""
+        stream = web.StreamResponse(headers={
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-cache',
+            'Connection': 'keep-alive',
+            'Access-Control-Allow-Origin': '*'
+        })
+
         try:
             # Set up SSE response headers
-            self.send_response(200)
-            self.send_header('Content-Type', 'text/event-stream')
-            self.send_header('Cache-Control', 'no-cache')
-            self.send_header('Connection', 'keep-alive')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
+            await stream.prepare(request)
 
             # Mock streaming chunks
             chunks = [
@@ -1251,19 +1571,24 @@ class PresidioGatewayHandler(http.server.BaseHTTPRequestHandler):
                     # Add security scan info to first chunk
                     event["security_scan"] = detection_summary
 
-                self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
-                self.wfile.flush()
-                time.sleep(0.1)  # Small delay to simulate streaming
+                await stream.write(_SSE_PREFIX + orjson.dumps(event) + _SSE_SUFFIX)
+                await asyncio.sleep(0.1)  # Small delay to simulate streaming without blocking the loop
 
             # Send final [DONE] event
-            self.wfile.write(b"data: [DONE]\n\n")
-            self.wfile.flush()
+            await stream.write(_SSE_DONE)
 
         except Exception as e:
-            print(f"Error in mock streaming: {e}")
+            logger.error(f"❌ Error in mock streaming: {e}")
+
+        return stream
 
     def _create_mock_response(self, request_id, messages, issues, detection_summary):
         """Create mock response when DeepSeek is not available"""
+        prompt_tokens = sum(
+            len(content.split())
+            for content in (msg.get('content') or '' for msg in messages)
+            if isinstance(content, str)
+        )
         return {
             "id": f"presidio-{request_id}",
             "object": "chat.completion",
@@ -1278,9 +1603,9 @@ class PresidioGatewayHandler(http.server.BaseHTTPRequestHandler):
                 "finish_reason": "stop"
             }],
             "usage": {
-                "prompt_tokens": sum(len(msg.get('content', '').split()) for msg in messages),
+                "prompt_tokens": prompt_tokens,
                 "completion_tokens": 25,
-                "total_tokens": sum(len(msg.get('content', '').split()) for msg in messages) + 25
+                "total_tokens": prompt_tokens + 25
             },
             "security_scan": {
                 "detection_engine": "Microsoft Presidio + Custom Patterns",
@@ -1293,28 +1618,96 @@ class PresidioGatewayHandler(http.server.BaseHTTPRequestHandler):
             }
         }
 
-    def send_json(self, data, status=200):
+    def send_json(self, data, status=200) -> web.Response:
         """Send JSON response"""
-        self.send_response(status)
-        self.send_header('Content-Type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.end_headers()
-        self.wfile.write(json.dumps(data, indent=2).encode())
+        # A complete web.Response gets an explicit Content-Length, and aiohttp writes
+        # the status line, headers and body to the transport in a single call
+        return web.Response(
+            status=status,
+            body=orjson.dumps(data),
+            content_type='application/json',
+            headers={'Access-Control-Allow-Origin': '*'}
+        )
 
-    def log_message(self, format, *args):
-        """Suppress default logs"""
-        return
+    def send_error(self, status, message) -> web.Response:
+        """Send plain-text error response"""
+        return web.Response(
+            status=status,
+            text=message,
+            headers={'Access-Control-Allow-Origin': '*'}
+        )
 
 
-async def initialize_global_detector():
+def enable_spacy_gpu() -> bool:
+    """Run spaCy on the GPU when PRESIDIO_USE_GPU=1, falling back to CPU"""
+    if not SPACY_AVAILABLE or os.getenv('PRESIDIO_USE_GPU') != '1':
+        return False
+
+    try:
+        return bool(spacy.prefer_gpu())
+    except Exception as e:
+        logger.warning(f"⚠️ spaCy GPU unavailable, using CPU: {e}")
+        return False
+
+
+async def initialize_global_detector(app=None):
     """Initialize the global detector instance"""
+    # Must run before any spaCy model is loaded. Done per process rather than in
+    # main() so forked workers never inherit a CUDA context from the parent.
+    if enable_spacy_gpu():
+        logger.info("✅ spaCy running on GPU")
     await PresidioGatewayHandler.initialize_detector()
 
 
+async def open_http_session(app):
+    """Create the keep-alive client session reused for every DeepSeek call"""
+    PresidioGatewayHandler.http_session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=64),
+        json_serialize=lambda data: orjson.dumps(data).decode(),
+        timeout=aiohttp.ClientTimeout(sock_connect=30, sock_read=30)
+    )
+
+
+async def close_http_session(app):
+    """Close the DeepSeek client session on shutdown"""
+    if PresidioGatewayHandler.http_session is not None:
+        await PresidioGatewayHandler.http_session.close()
+        PresidioGatewayHandler.http_session = None
+
+
+def create_app() -> web.Application:
+    """Build the aiohttp application with all gateway routes"""
+    handler = PresidioGatewayHandler()
+
+    app = web.Application(client_max_size=MAX_BODY_BYTES)
+    app.router.add_get('/health', handler.send_health)
+    app.router.add_get('/stats', handler.send_stats)
+    app.router.add_get('/presidio-status', handler.send_presidio_status)
+    app.router.add_get('/v1/models', handler.send_models)
+    app.router.add_get('/', handler.send_welcome)
+    app.router.add_post('/v1/chat/completions', handler.handle_chat)
+    app.router.add_route('OPTIONS', '/{tail:.*}', handler.handle_options)
+
+    # Load models and open the DeepSeek session before the first request is accepted
+    app.on_startup.append(initialize_global_detector)
+    app.on_startup.append(open_http_session)
+    app.on_cleanup.append(close_http_session)
+    return app
+
+
+def run_server(host: str, port: int, reuse_port: bool = False):
+    """Run one gateway server process on its own event loop"""
+    if UVLOOP_AVAILABLE:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+    web.run_app(create_app(), host=host, port=port, print=None, access_log=None, reuse_port=reuse_port)
+
+
 def main():
     """Start the Presidio-enhanced gateway"""
     PORT = int(os.getenv('PORT', 8000))
     HOST = "0.0.0.0"
+    WORKERS = max(1, int(os.getenv('WORKERS', 1)))
 
     print("Microsoft Presidio-Enhanced LLM Gateway")
     print("=" * 60)
@@ -1332,18 +1725,39 @@ def main():
         print(f"DeepSeek API: ❌ Not configured")
         print(f"Response Mode: Mock responses (add DEEPSEEK_API_KEY for real responses)")
 
+    if os.getenv('PRESIDIO_USE_GPU') == '1':
+        print(f"spaCy GPU: {'✅ Requested (CPU fallback if unavailable)' if SPACY_AVAILABLE else '❌ spaCy not installed'}")
+    else:
+        print("spaCy GPU: Off (set PRESIDIO_USE_GPU=1 to enable)")
+    print(f"Event Loop: {'uvloop' if UVLOOP_AVAILABLE else 'asyncio'}")
+    print(f"Workers: {WORKERS}")
     print("=" * 60)
 
-    # Initialize detector
-    print("🚀 Initializing security detector...")
-    asyncio.run(initialize_global_detector())
-    print("✅ Security detector ready!")
-
     try:
-        with socketserver.TCPServer((HOST, PORT), PresidioGatewayHandler) as httpd:
-            print(f"🌐 Presidio Gateway running on port {PORT}")
-            print("🔒 Enterprise ML security active!")
-            httpd.serve_forever()
+        print(f"🌐 Presidio Gateway running on port {PORT}")
+        print("🔒 Enterprise ML security active!")
+
+        if WORKERS == 1:
+            run_server(HOST, PORT)
+            return
+
+        # Load the spaCy model once here; forked workers share its pages copy-on-write
+        # (a CUDA context can't cross fork, so GPU workers still load their own).
+        # gc.freeze() keeps the collector from touching, and so copying, those pages.
+        if os.getenv('PRESIDIO_USE_GPU') != '1':
+            asyncio.run(PresidioGatewayHandler.initialize_detector())
+            gc.freeze()
+
+        # Each worker binds the same port with SO_REUSEPORT; the kernel balances connections
+        fork = multiprocessing.get_context("fork")
+        workers = [
+            fork.Process(target=run_server, args=(HOST, PORT, True), name=f"gateway-worker-{i}")
+            for i in range(WORKERS)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
     except Exception as e:
         print(f"❌ Server error: {e}")
 
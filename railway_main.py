@@ -2,15 +2,33 @@
 Railway-optimized LLM Gateway
 Simplified version for Railway deployment
 """
-import json
 import os
+import gc
 import time
-import uuid
+import hashlib
+import itertools
+import multiprocessing
 import re
-from http.server import HTTPServer, BaseHTTPRequestHandler
-from urllib.request import Request, urlopen
-from urllib.error import HTTPError
-from urllib.parse import urlparse, parse_qs
+from collections import OrderedDict
+
+import aiohttp
+import orjson
+from aiohttp import web
+
+try:
+    import hyperscan
+    HYPERSCAN_AVAILABLE = True
+except ImportError:
+    HYPERSCAN_AVAILABLE = False
+
+
+# Process-local request counter; ids only tag log lines, so they need not be random
+_REQ_COUNTER = itertools.count()
+
+
+def next_request_id():
+    """Return a short id unique within this host: pid plus a per-process counter"""
+    return f"{os.getpid():x}-{next(_REQ_COUNTER):x}"
 
 
 class SecurityScanner:
@@ -31,25 +49,137 @@ class SecurityScanner:
             "credit_card": r'\b\d{4}[\s-]?\d{4}[\s-]?\d{4}[\s-]?\d{4}\b',
 
             # Generic secrets
-            "generic_api_key": r'["\']?[a-z_]*api[_-]?key["\']?\s*[:=]\s*["\']?[a-zA-Z0-9\-_]{20,}["\']?',
-            "password": r'["\']?password["\']?\s*[:=]\s*["\']?[a-zA-Z0-9\-_!@#$%^&*()]{8,}["\']?',
+            "generic_api_key": r'api[_-]?key["\']?\s*[:=]\s*["\']?[a-zA-Z0-9\-_]{20,}',
+            "password": r'password["\']?\s*[:=]\s*["\']?[a-zA-Z0-9\-_!@#$%^&*()]{8,}',
             "jwt_token": r'eyJ[a-zA-Z0-9\-_]+\.[a-zA-Z0-9\-_]+\.[a-zA-Z0-9\-_]+',
             "private_key": r'-----BEGIN [A-Z ]+PRIVATE KEY-----',
         }
 
+        # Only these need case folding; token prefixes and PEM headers have a fixed
+        # case, and the rest already spell out both cases or match digits only
+        self.caseless = frozenset({"email", "generic_api_key", "password"})
+
+        # Literal every match must contain (lower-case for caseless patterns); patterns
+        # whose literal is absent are skipped without running the regex. None means no
+        # usable literal.
+        self.anchors = {
+            "openai_api_key": "sk-",
+            "anthropic_api_key": "sk-ant-",
+            "github_token": "ghp_",
+            "aws_access_key": "AKIA",
+            "email": "@",
+            "phone_us": "-",
+            "ssn": "-",
+            "credit_card": None,
+            "generic_api_key": "api",
+            "password": "password",
+            "jwt_token": "eyJ",
+            "private_key": "-----BEGIN ",
+        }
+
+        # Phone, SSN and card numbers all need a run of at least three digits; one
+        # probe decides whether any of them can match
+        self.digit_patterns = frozenset({"phone_us", "ssn", "credit_card"})
+        self.digit_run = re.compile(r'\d{3}')
+
+        # Necessary conditions for any match at all: one of the literals, or a digit
+        # run (card numbers are the only pattern without a literal)
+        self.literal_hints = tuple({anchor.casefold() for anchor in self.anchors.values() if anchor})
+
         self.compiled_patterns = {
-            name: re.compile(pattern, re.IGNORECASE)
+            name: re.compile(pattern, re.IGNORECASE if name in self.caseless else 0)
             for name, pattern in self.patterns.items()
         }
 
+        # ASCII characters that Python's \s matches but Hyperscan's does not; text
+        # containing any of them stays on the re path
+        self.narrow_space = re.compile('[\x1c-\x1f]')
+
+        # All patterns in one Hyperscan database: a single pass reports which ones occur
+        self.pattern_names = list(self.patterns)
+        self.database = self._compile_database() if HYPERSCAN_AVAILABLE else None
+
+        # LRU of recent results keyed by content digest; system prompts and chat
+        # history repeat across requests
+        self.cache = OrderedDict()
+        self.cache_size = 4096
+
+    def _compile_database(self):
+        """Compile every pattern into a Hyperscan block-mode database"""
+        count = len(self.pattern_names)
+        try:
+            database = hyperscan.Database()
+            database.compile(
+                expressions=[self.patterns[name].encode() for name in self.pattern_names],
+                ids=list(range(count)),
+                elements=count,
+                flags=[
+                    hyperscan.HS_FLAG_SINGLEMATCH
+                    | (hyperscan.HS_FLAG_CASELESS if name in self.caseless else 0)
+                    for name in self.pattern_names
+                ]
+            )
+            self.scratch = hyperscan.Scratch(database)
+            return database
+        except Exception as e:
+            print(f"⚠️ Hyperscan unavailable, using re: {e}")
+            return None
+
     def scan(self, text):
-        """Scan text for security issues"""
-        issues = []
-        for name, pattern in self.compiled_patterns.items():
-            if pattern.search(text):
-                issues.append(name)
+        """Scan text for security issues, serving recently seen text from the cache"""
+        key = hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.cache.move_to_end(key)
+            return list(cached)
+
+        issues = self._scan(text)
+        self.cache[key] = tuple(issues)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
         return issues
 
+    def _scan(self, text):
+        """Run the patterns over text"""
+        # Hyperscan's \b, \d and case folding are ASCII-only, and its \s leaves out
+        # \x1c-\x1f; re handles everything else
+        if self.database is None or not text.isascii() or self.narrow_space.search(text):
+            # IGNORECASE also matches i against dotless ı and dotted İ, which
+            # casefold leaves as ı and i + U+0307
+            folded = text.casefold().replace('\u0131', 'i').replace('\u0307', '')
+            has_digits = self.digit_run.search(text) is not None
+            if not has_digits and not any(hint in folded for hint in self.literal_hints):
+                return []
+
+            issues = []
+            for name, pattern in self.compiled_patterns.items():
+                if not has_digits and name in self.digit_patterns:
+                    continue
+                anchor = self.anchors[name]
+                if anchor is not None and anchor not in (folded if name in self.caseless else text):
+                    continue
+                if pattern.search(text):
+                    issues.append(name)
+            return issues
+
+        found = set()
+        try:
+            self.database.scan(
+                text.encode('ascii'),
+                match_event_handler=self._on_match,
+                context=found,
+                scratch=self.scratch
+            )
+        except hyperscan.ScanTerminated:
+            # _on_match stopped the scan because every pattern already matched
+            pass
+        return [name for index, name in enumerate(self.pattern_names) if index in found]
+
+    def _on_match(self, pattern_id, start, end, flags, found):
+        """Record a matching pattern; stop once every pattern has matched"""
+        found.add(pattern_id)
+        return len(found) == len(self.pattern_names)
+
 
 class DeepSeekClient:
     """DeepSeek API client"""
@@ -57,13 +187,27 @@ class DeepSeekClient:
     def __init__(self):
         self.api_key = os.getenv('DEEPSEEK_API_KEY')
         self.base_url = os.getenv('DEEPSEEK_BASE_URL', 'https://api.deepseek.com')
-
-    def chat_completion(self, messages, model="deepseek-chat", **kwargs):
+        self.session = None
+
+    async def open(self):
+        """Create the keep-alive session reused for every DeepSeek call"""
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=256, ttl_dns_cache=300, keepalive_timeout=60),
+            timeout=aiohttp.ClientTimeout(total=30)
+        )
+
+    async def close(self):
+        """Close the DeepSeek session on shutdown"""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def chat_completion(self, messages, model="deepseek-chat", **kwargs):
         """Send request to DeepSeek API"""
         if not self.api_key:
             # Return mock response if no API key
             return {
-                "id": f"mock-{uuid.uuid4().hex[:8]}",
+                "id": f"mock-{next_request_id()}",
                 "object": "chat.completion",
                 "created": int(time.time()),
                 "model": model,
@@ -83,90 +227,75 @@ class DeepSeekClient:
             }
 
         # Real API call
+        try:
+            async with self._post(messages, model, stream=False, **kwargs) as response:
+                status = response.status
+                body = await response.read()
+
+        except Exception as e:
+            raise Exception(f"DeepSeek API error: {str(e)}")
+
+        if status >= 400:
+            raise Exception(f"DeepSeek API error {status}: {body.decode(errors='replace')}")
+        return orjson.loads(body)
+
+    async def stream_chat_completion(self, messages, model="deepseek-chat", **kwargs):
+        """Stream a DeepSeek completion, yielding the upstream SSE bytes as they arrive"""
+        async with self._post(messages, model, stream=True, **kwargs) as response:
+            if response.status >= 400:
+                body = await response.read()
+                raise Exception(f"DeepSeek API error {response.status}: {body.decode(errors='replace')}")
+            async for chunk in response.content.iter_any():
+                yield chunk
+
+    def _post(self, messages, model, stream, **kwargs):
+        """Start a chat completion request on the pooled session"""
         payload = {
             "model": model,
             "messages": messages,
             "temperature": kwargs.get("temperature", 0.7),
             "max_tokens": kwargs.get("max_tokens", 1000),
         }
+        if stream:
+            payload["stream"] = True
 
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
 
-        try:
-            req = Request(
-                f"{self.base_url}/v1/chat/completions",
-                data=json.dumps(payload).encode(),
-                headers=headers
-            )
-
-            with urlopen(req, timeout=30) as response:
-                return json.loads(response.read().decode())
-
-        except HTTPError as e:
-            error_msg = e.read().decode() if e.fp else str(e)
-            raise Exception(f"DeepSeek API error {e.code}: {error_msg}")
-        except Exception as e:
-            raise Exception(f"DeepSeek API error: {str(e)}")
+        options = {}
+        if stream:
+            # A long stream may outlive the session's total timeout; bound the gaps instead
+            options["timeout"] = aiohttp.ClientTimeout(total=None, sock_read=30)
 
+        return self.session.post(
+            f"{self.base_url}/v1/chat/completions",
+            data=orjson.dumps(payload),
+            headers=headers,
+            **options
+        )
 
-class GatewayHandler(BaseHTTPRequestHandler):
-    """HTTP request handler for the gateway"""
 
-    def __init__(self, *args, **kwargs):
-        self.scanner = SecurityScanner()
-        self.deepseek = DeepSeekClient()
-        self.block_on_detection = os.getenv('BLOCK_ON_DETECTION', 'true').lower() == 'true'
-        super().__init__(*args, **kwargs)
+# Built once per process and shared by every request
+_SCANNER = SecurityScanner()
+_DEEPSEEK = DeepSeekClient()
+BLOCK_ON_DETECTION = os.getenv('BLOCK_ON_DETECTION', 'true').lower() == 'true'
 
-    def do_GET(self):
-        """Handle GET requests"""
-        if self.path == '/health':
-            self.send_health_response()
-        elif self.path == '/':
-            self.send_welcome_response()
-        else:
-            self.send_error(404, "Not Found")
+# Chat request bodies above this are rejected with 413 before being read
+MAX_BODY_BYTES = int(os.getenv('MAX_BODY_BYTES', 256 * 1024))
 
-    def do_POST(self):
-        """Handle POST requests"""
-        if self.path == '/v1/chat/completions':
-            self.handle_chat_completion()
-        else:
-            self.send_error(404, "Not Found")
 
-    def do_OPTIONS(self):
-        """Handle CORS preflight requests"""
-        self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
-        self.end_headers()
+# CORS headers sent with every API response
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization'
+}
 
-    def send_health_response(self):
-        """Send health check response"""
-        response = {
-            "status": "healthy",
-            "version": "1.0.0-railway",
-            "timestamp": int(time.time()),
-            "components": {
-                "security_scanner": True,
-                "deepseek_client": bool(self.deepseek.api_key),
-                "blocking_enabled": self.block_on_detection
-            },
-            "environment": {
-                "platform": "Railway",
-                "python_version": "3.11+",
-                "deployment": "production"
-            }
-        }
-        self.send_json_response(response)
 
-    def send_welcome_response(self):
-        """Send welcome page"""
-        html = f"""
+# Landing page; everything on it is fixed for the life of the process
+WELCOME_HTML = f"""
         <html>
         <head><title>🚀 LLM Gateway - Railway</title></head>
         <body style="font-family: Arial, sans-serif; max-width: 800px; margin: 50px auto; padding: 20px;">
@@ -178,8 +307,8 @@ class GatewayHandler(BaseHTTPRequestHandler):
             <ul>
                 <li>✅ PII Detection (emails, phones, SSNs)</li>
                 <li>✅ Secret Detection (API keys, passwords)</li>
-                <li>✅ Request Blocking: {'Enabled' if self.block_on_detection else 'Disabled'}</li>
-                <li>✅ DeepSeek Integration: {'Configured' if self.deepseek.api_key else 'Mock Mode'}</li>
+                <li>✅ Request Blocking: {'Enabled' if BLOCK_ON_DETECTION else 'Disabled'}</li>
+                <li>✅ DeepSeek Integration: {'Configured' if _DEEPSEEK.api_key else 'Mock Mode'}</li>
             </ul>
 
             <h2>📡 API Endpoints</h2>
@@ -211,27 +340,64 @@ curl -X POST {os.getenv('RAILWAY_PUBLIC_DOMAIN', 'your-app.railway.app')}/v1/cha
             <p><em>Deployed on Railway • <a href="https://github.com/your-repo">Source Code</a></em></p>
         </body>
         </html>
-        """
-        self.send_response(200)
-        self.send_header('Content-type', 'text/html')
-        self.end_headers()
-        self.wfile.write(html.encode())
+        """.encode()
 
-    def handle_chat_completion(self):
+
+class GatewayHandler:
+    """aiohttp request handlers for the gateway"""
+
+    def __init__(self):
+        self.scanner = _SCANNER
+        self.deepseek = _DEEPSEEK
+        self.block_on_detection = BLOCK_ON_DETECTION
+
+    async def handle_options(self, request):
+        """Handle CORS preflight requests"""
+        return web.Response(headers=CORS_HEADERS)
+
+    async def send_health_response(self, request):
+        """Send health check response"""
+        response = {
+            "status": "healthy",
+            "version": "1.0.0-railway",
+            "timestamp": int(time.time()),
+            "components": {
+                "security_scanner": True,
+                "deepseek_client": bool(self.deepseek.api_key),
+                "blocking_enabled": self.block_on_detection
+            },
+            "environment": {
+                "platform": "Railway",
+                "python_version": "3.11+",
+                "deployment": "production"
+            }
+        }
+        return self.send_json_response(response)
+
+    async def send_welcome_response(self, request):
+        """Send welcome page"""
+        # The page is a couple of KB already in memory; aiohttp writes it together with
+        # the headers, which beats a per-request open/fstat/sendfile round trip
+        return web.Response(body=WELCOME_HTML, content_type='text/html', charset='utf-8')
+
+    async def handle_chat_completion(self, request):
         """Handle chat completion requests"""
-        request_id = uuid.uuid4().hex[:8]
+        request_id = next_request_id()
 
         try:
-            # Read request body
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            request_data = json.loads(post_data.decode('utf-8'))
+            if (request.content_length or 0) > MAX_BODY_BYTES:
+                return self.send_error(413, "Request body too large")
+
+            # Chunked bodies have no Content-Length; client_max_size caps them while reading
+            try:
+                post_data = await request.read()
+            except web.HTTPRequestEntityTooLarge:
+                return self.send_error(413, "Request body too large")
+            request_data = orjson.loads(post_data)
 
             # Extract text content from messages
-            text_content = ""
             messages = request_data.get('messages', [])
-            for message in messages:
-                text_content += message.get('content', '') + "\n"
+            text_content = "\n".join(message.get('content') or '' for message in messages)
 
             # Security scanning
             security_issues = self.scanner.scan(text_content)
@@ -250,11 +416,14 @@ curl -X POST {os.getenv('RAILWAY_PUBLIC_DOMAIN', 'your-app.railway.app')}/v1/cha
                     "blocked": True
                 }
                 print(f"  ❌ Request {request_id} blocked: {security_issues}")
-                self.send_json_response(error_response, status_code=400)
-                return
+                return self.send_json_response(error_response, status_code=400)
+
+            # Stream straight through when the client asked for it
+            if request_data.get('stream') and self.deepseek.api_key:
+                return await self.stream_chat_completion(request, request_id, messages, request_data)
 
             # Forward to DeepSeek
-            response = self.deepseek.chat_completion(
+            response = await self.deepseek.chat_completion(
                 messages=messages,
                 model=request_data.get('model', 'deepseek-chat'),
                 temperature=request_data.get('temperature', 0.7),
@@ -262,34 +431,103 @@ curl -X POST {os.getenv('RAILWAY_PUBLIC_DOMAIN', 'your-app.railway.app')}/v1/cha
             )
 
             print(f"  ✅ Request {request_id} processed successfully")
-            self.send_json_response(response)
+            return self.send_json_response(response)
 
-        except json.JSONDecodeError:
+        except orjson.JSONDecodeError:
             print(f"  ❌ Request {request_id} failed: Invalid JSON")
-            self.send_error(400, "Invalid JSON")
+            return self.send_error(400, "Invalid JSON")
         except Exception as e:
             print(f"  ❌ Request {request_id} failed: {str(e)}")
-            self.send_error(500, f"Internal server error: {str(e)}")
+            return self.send_error(500, f"Internal server error: {str(e)}")
+
+    async def stream_chat_completion(self, request, request_id, messages, request_data):
+        """Relay DeepSeek's SSE stream to the client chunk by chunk"""
+        chunks = self.deepseek.stream_chat_completion(
+            messages=messages,
+            model=request_data.get('model', 'deepseek-chat'),
+            temperature=request_data.get('temperature', 0.7),
+            max_tokens=request_data.get('max_tokens', 1000)
+        )
+
+        # Wait for the first chunk so upstream errors still become a plain 500
+        try:
+            first_chunk = await anext(chunks)
+        except StopAsyncIteration:
+            first_chunk = b""
+
+        stream = web.StreamResponse(headers={
+            **CORS_HEADERS,
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-cache'
+        })
+        await stream.prepare(request)
+
+        try:
+            await stream.write(first_chunk)
+            async for chunk in chunks:
+                await stream.write(chunk)
+        except Exception as e:
+            # Headers are already out; all we can do is end the stream
+            print(f"  ❌ Request {request_id} stream aborted: {str(e)}")
+        else:
+            print(f"  ✅ Request {request_id} streamed successfully")
+            await stream.write_eof()
+        finally:
+            await chunks.aclose()
+
+        return stream
 
     def send_json_response(self, data, status_code=200):
         """Send JSON response"""
-        self.send_response(status_code)
-        self.send_header('Content-type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
-        self.end_headers()
-        self.wfile.write(json.dumps(data, indent=2).encode())
+        # No hand-built header bytes needed: aiohttp serialises the headers into one
+        # buffer and, for a body this small, sends it in the same transport write
+        return web.Response(
+            status=status_code,
+            body=orjson.dumps(data),
+            content_type='application/json',
+            headers=CORS_HEADERS
+        )
+
+    def send_error(self, status_code, message):
+        """Send plain-text error response"""
+        return web.Response(status=status_code, text=message, headers=CORS_HEADERS)
+
+
+async def open_deepseek_session(app):
+    """Open the pooled DeepSeek session before serving requests"""
+    await _DEEPSEEK.open()
+
+
+async def close_deepseek_session(app):
+    """Close the DeepSeek session on shutdown"""
+    await _DEEPSEEK.close()
 
-    def log_message(self, format, *args):
-        """Override to customize logging"""
-        return  # Suppress default HTTP logs
+
+def create_app():
+    """Build the aiohttp application with the gateway routes"""
+    handler = GatewayHandler()
+
+    app = web.Application(client_max_size=MAX_BODY_BYTES)
+    app.router.add_get('/health', handler.send_health_response)
+    app.router.add_get('/', handler.send_welcome_response)
+    app.router.add_post('/v1/chat/completions', handler.handle_chat_completion)
+    app.router.add_route('OPTIONS', '/{tail:.*}', handler.handle_options)
+
+    app.on_startup.append(open_deepseek_session)
+    app.on_cleanup.append(close_deepseek_session)
+    return app
+
+
+def run_server(host, port, reuse_port=False):
+    """Run one gateway server process"""
+    web.run_app(create_app(), host=host, port=port, print=None, access_log=None, reuse_port=reuse_port)
 
 
 def main():
     """Start the gateway server"""
     PORT = int(os.getenv('PORT', 8000))
     HOST = "0.0.0.0"
+    WORKERS = max(1, int(os.getenv('WORKERS', os.cpu_count() or 1)))
 
     print("🚀 LLM Gateway Starting on Railway")
     print("=" * 50)
@@ -297,16 +535,30 @@ def main():
     print(f"Port: {PORT}")
     print(f"DeepSeek API: {'Configured' if os.getenv('DEEPSEEK_API_KEY') else 'Mock Mode'}")
     print(f"Security Blocking: {os.getenv('BLOCK_ON_DETECTION', 'true')}")
+    print(f"Workers: {WORKERS}")
     print("=" * 50)
 
     try:
-        # Create server
-        server = HTTPServer((HOST, PORT), GatewayHandler)
-        print(f"✅ Server created on {HOST}:{PORT}")
-
         # Start server
         print("🚀 Starting server...")
-        server.serve_forever()
+        if WORKERS == 1:
+            run_server(HOST, PORT)
+            return
+
+        # The scanner (and its Hyperscan database) was built at import, so forked
+        # workers share it copy-on-write; gc.freeze() keeps the collector off those pages
+        gc.freeze()
+
+        # Each worker binds the same port with SO_REUSEPORT; the kernel balances connections
+        fork = multiprocessing.get_context("fork")
+        workers = [
+            fork.Process(target=run_server, args=(HOST, PORT, True), name=f"gateway-worker-{i}")
+            for i in range(WORKERS)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
 
     except OSError as e:
         print(f"❌ Port binding error: {e}")
@@ -4,32 +4,79 @@ Using Microsoft Presidio + Custom Rules + ML Models
 """
 import re
 import time
+import bisect
+import importlib.util
 import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
 from typing import List, Dict, Any, Optional, Tuple
 from dataclasses import dataclass
 from enum import Enum
 import logging
 
-# Try to import Presidio (graceful fallback if not available)
-try:
-    from presidio_analyzer import AnalyzerEngine, RecognizerRegistry
-    from presidio_analyzer.nlp_engine import NlpEngineProvider
-    PRESIDIO_AVAILABLE = True
-except ImportError:
-    PRESIDIO_AVAILABLE = False
+# Presidio, phonenumbers and validators are only located here and imported on first
+# use, so importing this module doesn't pay for libraries a deployment never touches
+PRESIDIO_AVAILABLE = importlib.util.find_spec("presidio_analyzer") is not None
+PHONENUMBERS_AVAILABLE = importlib.util.find_spec("phonenumbers") is not None
+VALIDATORS_AVAILABLE = importlib.util.find_spec("validators") is not None
+
+_phonenumbers = None
+_validators = None
+
+
+def _get_phonenumbers():
+    """Import phonenumbers on first use"""
+    global _phonenumbers
+    if _phonenumbers is None:
+        import phonenumbers
+        _phonenumbers = phonenumbers
+    return _phonenumbers
+
+
+def _get_validators():
+    """Import validators on first use"""
+    global _validators
+    if _validators is None:
+        import validators
+        _validators = validators
+    return _validators
 
-# Try to import additional libraries
 try:
-    import phonenumbers
-    PHONENUMBERS_AVAILABLE = True
+    import hyperscan
+    HYPERSCAN_AVAILABLE = True
 except ImportError:
-    PHONENUMBERS_AVAILABLE = False
+    HYPERSCAN_AVAILABLE = False
 
 try:
-    import validators
-    VALIDATORS_AVAILABLE = True
+    import re2
+    RE2_AVAILABLE = True
 except ImportError:
-    VALIDATORS_AVAILABLE = False
+    RE2_AVAILABLE = False
+
+# Luhn lookup tables over ASCII digit bytes: a digit's value, and the digit sum of
+# twice its value. bytes.translate applies them to a whole card number in C.
+_LUHN_DIGIT = bytes.maketrans(b'0123456789', bytes(range(10)))
+_LUHN_DOUBLED = bytes.maketrans(b'0123456789', bytes([0, 2, 4, 6, 8, 1, 3, 5, 7, 9]))
+
+# Every byte except the ASCII digits, for bytes.translate's delete argument
+_NON_DIGIT_BYTES = bytes(byte for byte in range(256) if byte not in b'0123456789')
+
+# ASCII whitespace to Python's str \s that Hyperscan's \s does not match
+_HYPERSCAN_NARROW_SPACE = re.compile(rb'[\x1c-\x1f]')
+
+# ASCII whitespace to Python's str \s that the ASCII regexes' \s does not match:
+# bytes patterns leave out \x1c-\x1f, and RE2 also leaves out \v
+_ASCII_NARROW_SPACE = re.compile('[\x0b\x1c-\x1f]')
+
+
+# Entities requested from Presidio on every scan
+PRESIDIO_ENTITIES = [
+    "CREDIT_CARD", "EMAIL_ADDRESS", "IBAN_CODE", "IP_ADDRESS",
+    "PERSON", "PHONE_NUMBER", "US_SSN", "US_PASSPORT",
+    "US_DRIVER_LICENSE", "DATE_TIME", "LOCATION", "URL",
+    "US_BANK_NUMBER", "CRYPTO", "MEDICAL_LICENSE"
+]
 
 
 class DetectionLevel(Enum):
@@ -40,7 +87,13 @@ class DetectionLevel(Enum):
     CRITICAL = 0.95
 
 
-@dataclass
+# Severity thresholds in ascending order; bisecting a confidence into them gives the
+# index of its level in _SEVERITY_LEVELS
+_SEVERITY_THRESHOLDS = (DetectionLevel.MEDIUM.value, DetectionLevel.HIGH.value, DetectionLevel.CRITICAL.value)
+_SEVERITY_LEVELS = (DetectionLevel.LOW, DetectionLevel.MEDIUM, DetectionLevel.HIGH, DetectionLevel.CRITICAL)
+
+
+@dataclass(slots=True)
 class SecurityIssue:
     """Represents a detected security issue"""
     type: str
@@ -65,15 +118,28 @@ class AdvancedSecurityDetector:
         
         # Initialize detection engines
         self.presidio_analyzer = None
+        self._presidio_lock = threading.Lock()  # one analyzer, shared by worker threads
+        self.presidio_batch_size = self.config.get('presidio_batch_size', 32)
         self.custom_patterns = self._load_custom_patterns()
         self.ml_models = {}
+
+        # LRU of recent scan results keyed by content digest; system prompts and
+        # retried requests repeat the same text
+        self._scan_cache = OrderedDict()
+        self.scan_cache_size = self.config.get('scan_cache_size', 4096)
+
+        # custom_patterns compiled into parallel per-pattern tuples plus a
+        # Hyperscan database; rebuilt by _compile_patterns whenever patterns change
+        self._hyperscan_db = None
+        self._compile_patterns()
         
-        # Performance tracking
+        # Performance tracking. Every update is a single integer add on the event
+        # loop; get_stats derives the average scan time from the totals.
         self.detection_stats = {
             'total_scans': 0,
             'issues_found': 0,
             'blocked_requests': 0,
-            'avg_scan_time': 0.0
+            'total_scan_time_ns': 0
         }
     
     async def initialize(self):
@@ -94,6 +160,9 @@ class AdvancedSecurityDetector:
     async def _init_presidio(self):
         """Initialize Microsoft Presidio analyzer"""
         try:
+            from presidio_analyzer import AnalyzerEngine, RecognizerRegistry
+            from presidio_analyzer.nlp_engine import NlpEngineProvider
+            
             # Configure NLP engine
             configuration = {
                 "nlp_engine_name": "spacy",
@@ -122,16 +191,23 @@ class AdvancedSecurityDetector:
         """Initialize custom detection patterns"""
         self.logger.info("Loading custom detection patterns")
         
-        # Add high-confidence patterns for common secrets
+        # Add high-confidence patterns for common secrets. 'anchor' is a lower-case
+        # literal every match contains; without Hyperscan it lets a pattern be skipped
+        # when the literal is absent. 'needs_ignorecase': False marks patterns with no
+        # cased literals whose classes already list both cases, so on ASCII text they
+        # match the same without IGNORECASE and skip its cost. 'needs_digit' marks
+        # patterns that cannot match ASCII text without an ASCII digit in it.
         self.custom_patterns.update({
             # Cloud provider keys
             'aws_access_key_id': {
                 'pattern': r'AKIA[0-9A-Z]{16}',
+                'anchor': 'akia',
                 'confidence': 0.95,
                 'severity': DetectionLevel.CRITICAL
             },
             'aws_secret_key': {
                 'pattern': r'[A-Za-z0-9/+=]{40}',
+                'needs_ignorecase': False,
                 'confidence': 0.8,
                 'severity': DetectionLevel.HIGH,
                 'context_required': ['aws', 'secret']
@@ -140,11 +216,13 @@ class AdvancedSecurityDetector:
             # API Keys with high confidence
             'openai_api_key': {
                 'pattern': r'sk-[a-zA-Z0-9]{48}',
+                'anchor': 'sk-',
                 'confidence': 0.98,
                 'severity': DetectionLevel.CRITICAL
             },
             'anthropic_api_key': {
                 'pattern': r'sk-ant-[a-zA-Z0-9\-_]{95}',
+                'anchor': 'sk-ant-',
                 'confidence': 0.98,
                 'severity': DetectionLevel.CRITICAL
             },
@@ -152,6 +230,8 @@ class AdvancedSecurityDetector:
             # Database connections
             'database_url': {
                 'pattern': r'(postgresql|mysql|mongodb)://[^:\s]+:[^@\s]+@[^:\s]+:\d+/\w+',
+                'anchor': '://',
+                'needs_digit': True,
                 'confidence': 0.9,
                 'severity': DetectionLevel.CRITICAL
             },
@@ -159,6 +239,7 @@ class AdvancedSecurityDetector:
             # JWT tokens
             'jwt_token': {
                 'pattern': r'eyJ[a-zA-Z0-9\-_]+\.[a-zA-Z0-9\-_]+\.[a-zA-Z0-9\-_]+',
+                'anchor': 'eyj',
                 'confidence': 0.85,
                 'severity': DetectionLevel.HIGH
             },
@@ -166,6 +247,7 @@ class AdvancedSecurityDetector:
             # Private keys
             'private_key': {
                 'pattern': r'-----BEGIN [A-Z ]+PRIVATE KEY-----',
+                'anchor': '-----begin ',
                 'confidence': 0.99,
                 'severity': DetectionLevel.CRITICAL
             },
@@ -173,6 +255,8 @@ class AdvancedSecurityDetector:
             # Credit cards (Luhn algorithm validation)
             'credit_card': {
                 'pattern': r'\b(?:\d{4}[-\s]?){3}\d{4}\b',
+                'needs_ignorecase': False,
+                'needs_digit': True,
                 'confidence': 0.7,
                 'severity': DetectionLevel.HIGH,
                 'validator': self._validate_credit_card
@@ -181,6 +265,9 @@ class AdvancedSecurityDetector:
             # Social Security Numbers
             'ssn': {
                 'pattern': r'\b\d{3}-\d{2}-\d{4}\b',
+                'needs_ignorecase': False,
+                'needs_digit': True,
+                'anchor': '-',
                 'confidence': 0.9,
                 'severity': DetectionLevel.HIGH
             },
@@ -188,6 +275,8 @@ class AdvancedSecurityDetector:
             # Enhanced email detection
             'email_address': {
                 'pattern': r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b',
+                'needs_ignorecase': False,
+                'anchor': '@',
                 'confidence': 0.8,
                 'severity': DetectionLevel.MEDIUM,
                 'validator': self._validate_email
@@ -196,135 +285,365 @@ class AdvancedSecurityDetector:
             # Phone numbers
             'phone_number': {
                 'pattern': r'\b(?:\+?1[-.\s]?)?\(?[0-9]{3}\)?[-.\s]?[0-9]{3}[-.\s]?[0-9]{4}\b',
+                'needs_ignorecase': False,
+                'needs_digit': True,
                 'confidence': 0.7,
                 'severity': DetectionLevel.MEDIUM,
                 'validator': self._validate_phone
             }
         })
+
+        self._compile_patterns()
+
+    def _compile_patterns(self):
+        """Compile custom_patterns into the parallel tuples the scan loop indexes"""
+        # Compile every pattern once here instead of on each scan. They stay separate
+        # regexes: a fused alternation would let one pattern's match hide another
+        # overlapping one (a card number inside a phone-shaped span, say).
+        names = tuple(self.custom_patterns)
+        configs = [self.custom_patterns[name] for name in names]
+
+        self._pattern_names = names
+        self._pattern_regexes = tuple(
+            self._compile_re(name, config['pattern'], re.IGNORECASE) for name, config in zip(names, configs)
+        )
+        self._pattern_caseless = tuple(config.get('needs_ignorecase', True) for config in configs)
+        self._pattern_ascii_regexes = tuple(
+            self._compile_ascii(name, config['pattern'], caseless)
+            for name, config, caseless in zip(names, configs, self._pattern_caseless)
+        )
+        self._pattern_ascii_bytes = tuple(
+            regex is not None and isinstance(regex.pattern, bytes) for regex in self._pattern_ascii_regexes
+        )
+        self._pattern_descriptions = tuple(f"Custom pattern detected {name}" for name in names)
+        self._pattern_confidences = tuple(config['confidence'] for config in configs)
+        self._pattern_severities = tuple(config['severity'] for config in configs)
+        self._pattern_validators = tuple(config.get('validator') for config in configs)
+        self._pattern_contexts = tuple(tuple(config.get('context_required', ())) for config in configs)
+        self._pattern_anchors = tuple(config.get('anchor') for config in configs)
+        self._pattern_needs_digit = tuple(config.get('needs_digit', False) for config in configs)
+
+        self._hyperscan_db = None
+        if HYPERSCAN_AVAILABLE and names:
+            self._compile_hyperscan_prefilter()
+
+        # Cached results came from the previous pattern set
+        self._scan_cache.clear()
+
+    def _compile_re(self, name: str, pattern: str, flags: int):
+        """Compile one custom pattern with re, or None if it is invalid"""
+        try:
+            return re.compile(pattern, flags)
+        except re.error as e:
+            self.logger.error(f"Error in custom pattern {name}: {e}")
+            return None
+
+    def _compile_ascii(self, name: str, pattern: str, caseless: bool):
+        """Compile one custom pattern for ASCII text, preferring RE2"""
+        # RE2's matching time is linear in the input, but its \b, \d and case folding
+        # are ASCII-only, so it is only used for ASCII text. Patterns are compiled as
+        # bytes: ASCII text is encoded once per scan, and RE2 otherwise converts the
+        # whole str to UTF-8 on every finditer call.
+        encoded = pattern.encode('utf-8')
+        if RE2_AVAILABLE:
+            try:
+                return re2.compile(b'(?i)' + encoded if caseless else encoded)
+            except re2.error as e:
+                # Patterns RE2 can't express (backreferences, lookaround) stay on re
+                self.logger.warning(f"RE2 rejected pattern {name}, using re: {e}")
+        try:
+            return re.compile(encoded, re.IGNORECASE if caseless else 0)
+        except re.error:
+            # str-only escapes such as \u00e9 keep the pattern on str
+            return self._compile_re(name, pattern, re.IGNORECASE if caseless else 0)
+
+    def _compile_hyperscan_prefilter(self):
+        """Compile all custom patterns into one Hyperscan database used as a prefilter"""
+        # One pass over the text reports which patterns occur; re.finditer then runs
+        # only for those, so match boundaries and validators behave exactly as before
+        names = self._pattern_names
+        try:
+            database = hyperscan.Database()
+            database.compile(
+                expressions=[self.custom_patterns[name]['pattern'].encode() for name in names],
+                ids=list(range(len(names))),
+                elements=len(names),
+                flags=[
+                    hyperscan.HS_FLAG_SINGLEMATCH | (hyperscan.HS_FLAG_CASELESS if caseless else 0)
+                    for caseless in self._pattern_caseless
+                ]
+            )
+        except Exception as e:
+            self.logger.warning(f"Hyperscan prefilter disabled: {e}")
+            return
+
+        self._hyperscan_db = database
+
+    def _candidate_patterns(self, text: str, data: Optional[bytes] = None) -> List[int]:
+        """Indices of custom patterns that may match text; data is its ASCII encoding, if any"""
+        # Hyperscan's \b, \d and case folding are ASCII-only and its \s leaves out
+        # \x1c-\x1f; other text is narrowed down by each pattern's literal anchor instead
+        if self._hyperscan_db is None or data is None or _HYPERSCAN_NARROW_SPACE.search(data):
+            # IGNORECASE also matches i against dotless ı and dotted İ, which
+            # casefold leaves as ı and i + U+0307
+            folded = text.casefold().replace('\u0131', 'i').replace('\u0307', '')
+            # Deleting every non-digit byte is one C pass over the buffer; \d also
+            # matches non-ASCII digits, so other text is not gated on it
+            has_digit = data is None or bool(data.translate(None, _NON_DIGIT_BYTES))
+            return [
+                index for index, (anchor, needs_digit) in enumerate(zip(self._pattern_anchors, self._pattern_needs_digit))
+                if (anchor is None or anchor in folded) and (has_digit or not needs_digit)
+            ]
+
+        hits = set()
+        self._hyperscan_db.scan(
+            data,
+            match_event_handler=lambda pattern_id, start, end, flags, context: hits.add(pattern_id)
+        )
+        return sorted(hits)
     
     def _load_custom_patterns(self) -> Dict:
         """Load custom detection patterns from config"""
         return self.config.get('custom_patterns', {})
     
-    async def scan_content(self, text: str, context: Dict = None) -> List[SecurityIssue]:
+    async def scan_content(self, text: str, context: Dict = None, block_decision: bool = False) -> List[SecurityIssue]:
         """
         Comprehensive security scan of text content
         
         Args:
             text: Text content to scan
             context: Additional context (user_id, request_type, etc.)
+            block_decision: Only the should_block_request outcome is needed, so a
+                confirmed CRITICAL custom pattern match is returned on its own
+                without running the remaining detectors
             
         Returns:
             List of detected security issues
         """
-        start_time = time.time()
-        issues = []
+        if block_decision and self._scan_cache_key(text, context) not in self._scan_cache:
+            start_time = time.perf_counter_ns()
+            critical = await self._custom_pattern_scan(text, critical_only=True)
+            if critical:
+                self.detection_stats['total_scans'] += 1
+                self.detection_stats['issues_found'] += 1
+                self._update_performance_stats(time.perf_counter_ns() - start_time)
+                return critical
+        return (await self.scan_batch([text], [context]))[0]
+    
+    def _scan_cache_key(self, text: str, context: Optional[Dict]) -> Tuple[bytes, bool]:
+        """Scan cache key for text"""
+        # The context-aware layer only runs when a context is given, so that
+        # decision is part of the key
+        return (hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest(), bool(context))
+    
+    async def scan_batch(self, texts: List[str], contexts: Optional[List[Optional[Dict]]] = None) -> List[List[SecurityIssue]]:
+        """
+        Security scan of several texts at once
+        
+        Presidio's spaCy pipeline runs over all uncached texts as one batch, which
+        amortises its per-call overhead across them.
+        
+        Args:
+            texts: Text contents to scan
+            contexts: Per-text context, or None for no context
+            
+        Returns:
+            Detected security issues for each text, in order
+        """
+        if not texts:
+            return []
+        
+        start_time = time.perf_counter_ns()
+        if contexts is None:
+            contexts = [None] * len(texts)
         
         try:
             # Update stats
-            self.detection_stats['total_scans'] += 1
+            self.detection_stats['total_scans'] += len(texts)
             
-            # Multi-layer detection
-            if self.presidio_analyzer:
-                presidio_issues = await self._presidio_scan(text)
-                issues.extend(presidio_issues)
+            results = [None] * len(texts)
+            misses = []
+            for index, (text, context) in enumerate(zip(texts, contexts)):
+                key = self._scan_cache_key(text, context)
+                cached = self._scan_cache.get(key)
+                if cached is not None:
+                    self._scan_cache.move_to_end(key)
+                    results[index] = list(cached)
+                else:
+                    misses.append((index, key))
             
-            # Custom pattern detection
-            custom_issues = await self._custom_pattern_scan(text)
-            issues.extend(custom_issues)
-            
-            # Context-aware detection
-            if context:
-                context_issues = await self._context_aware_scan(text, context)
-                issues.extend(context_issues)
-            
-            # Deduplicate and rank issues
-            issues = self._deduplicate_issues(issues)
-            issues = sorted(issues, key=lambda x: x.confidence, reverse=True)
+            if misses:
+                detected = await self._run_detectors(
+                    [texts[index] for index, _ in misses],
+                    [contexts[index] for index, _ in misses]
+                )
+                for (index, key), issues in zip(misses, detected):
+                    results[index] = issues
+                    self._scan_cache[key] = tuple(issues)
+                    if len(self._scan_cache) > self.scan_cache_size:
+                        self._scan_cache.popitem(last=False)
             
             # Update stats
-            if issues:
-                self.detection_stats['issues_found'] += len(issues)
+            issue_count = sum(len(issues) for issues in results)
+            if issue_count:
+                self.detection_stats['issues_found'] += issue_count
             
-            scan_time = time.time() - start_time
-            self._update_performance_stats(scan_time)
+            scan_time_ns = time.perf_counter_ns() - start_time
+            self._update_performance_stats(scan_time_ns)
             
-            self.logger.info(f"Security scan completed: {len(issues)} issues found in {scan_time:.3f}s")
+            self.logger.info(f"Security scan completed: {issue_count} issues found in {len(texts)} texts in {scan_time_ns / 1e9:.3f}s")
             
-            return issues
+            return results
             
         except Exception as e:
             self.logger.error(f"Error during security scan: {e}")
-            return []
+            return [[] for _ in texts]
+    
+    async def _run_detectors(self, texts: List[str], contexts: List[Optional[Dict]]) -> List[List[SecurityIssue]]:
+        """Run every detection layer over texts, returning deduplicated ranked issues per text"""
+        # Multi-layer detection: Presidio runs in a worker thread while the
+        # custom pattern and context-aware layers run on the event loop. The
+        # Presidio task goes first so its thread starts before the regex work.
+        layers = [self._regex_scan(text, context) for text, context in zip(texts, contexts)]
+        if self.presidio_analyzer:
+            presidio_issues, *regex_issues = await asyncio.gather(self._presidio_scan_batch(texts), *layers)
+        else:
+            presidio_issues, regex_issues = [[] for _ in texts], await asyncio.gather(*layers)
+        
+        results = []
+        for from_presidio, from_regex in zip(presidio_issues, regex_issues):
+            # Deduplicate and rank issues
+            issues = self._deduplicate_issues(from_presidio + from_regex)
+            results.append(sorted(issues, key=lambda x: x.confidence, reverse=True))
+        return results
+    
+    async def _regex_scan(self, text: str, context: Optional[Dict]) -> List[SecurityIssue]:
+        """Custom pattern detection, plus context-aware detection when a context is given"""
+        # Both layers search the lower-cased text; share one copy when both run
+        lowered = text.lower() if context else None
+        issues = await self._custom_pattern_scan(text, lowered)
+        if context:
+            issues.extend(await self._context_aware_scan(text, context, lowered))
+        return issues
     
     async def _presidio_scan(self, text: str) -> List[SecurityIssue]:
         """Scan using Microsoft Presidio"""
+        return (await self._presidio_scan_batch([text]))[0]
+    
+    async def _presidio_scan_batch(self, texts: List[str]) -> List[List[SecurityIssue]]:
+        """Scan texts using Microsoft Presidio, one spaCy batch for all of them"""
         if not self.presidio_analyzer:
-            return []
+            return [[] for _ in texts]
+        
+        # spaCy releases the GIL for much of its work, so this overlaps the regex layers
+        return await asyncio.to_thread(self._presidio_scan_batch_sync, texts)
+    
+    def _presidio_scan_batch_sync(self, texts: List[str]) -> List[List[SecurityIssue]]:
+        """Run the Presidio analyzer over a batch; called from a worker thread"""
         
         try:
-            # Define entities to detect
-            entities = [
-                "CREDIT_CARD", "EMAIL_ADDRESS", "IBAN_CODE", "IP_ADDRESS",
-                "PERSON", "PHONE_NUMBER", "US_SSN", "US_PASSPORT",
-                "US_DRIVER_LICENSE", "DATE_TIME", "LOCATION", "URL",
-                "US_BANK_NUMBER", "CRYPTO", "MEDICAL_LICENSE"
-            ]
-            
-            # Run analysis
-            results = self.presidio_analyzer.analyze(
-                text=text,
-                entities=entities,
-                language='en'
-            )
-            
-            issues = []
-            for result in results:
-                issue = SecurityIssue(
-                    type=result.entity_type.lower(),
-                    description=f"Presidio detected {result.entity_type}",
-                    confidence=result.score,
-                    location=(result.start, result.end),
-                    severity=self._confidence_to_severity(result.score),
-                    context=text[max(0, result.start-20):result.end+20],
-                    detector="presidio"
+            # Run analysis: tokenise and tag every text in one nlp.pipe pass, then
+            # run the recognizers on each text's precomputed NLP artifacts
+            with self._presidio_lock:
+                analyzer = self.presidio_analyzer
+                processed = analyzer.nlp_engine.process_batch(
+                    texts,
+                    language='en',
+                    batch_size=self.presidio_batch_size
                 )
-                issues.append(issue)
+                batch_results = [
+                    analyzer.analyze(
+                        text=text,
+                        entities=PRESIDIO_ENTITIES,
+                        language='en',
+                        nlp_artifacts=nlp_artifacts
+                    )
+                    for text, nlp_artifacts in processed
+                ]
             
-            return issues
+            batch_issues = []
+            for text, results in zip(texts, batch_results):
+                issues = []
+                for result in results:
+                    issue = SecurityIssue(
+                        type=result.entity_type.lower(),
+                        description=f"Presidio detected {result.entity_type}",
+                        confidence=result.score,
+                        location=(result.start, result.end),
+                        severity=self._confidence_to_severity(result.score),
+                        context=text[max(0, result.start-20):result.end+20],
+                        detector="presidio"
+                    )
+                    issues.append(issue)
+                batch_issues.append(issues)
+            
+            return batch_issues
             
         except Exception as e:
             self.logger.error(f"Presidio scan error: {e}")
-            return []
+            return [[] for _ in texts]
     
-    async def _custom_pattern_scan(self, text: str) -> List[SecurityIssue]:
-        """Scan using custom regex patterns"""
+    async def _custom_pattern_scan(self, text: str, lowered: Optional[str] = None,
+                                   critical_only: bool = False) -> List[SecurityIssue]:
+        """
+        Scan using custom regex patterns; lowered is text.lower() if the caller has it
+        
+        With critical_only, only CRITICAL patterns run and the scan stops at the
+        first confirmed match.
+        """
         issues = []
+
+        # Text with whitespace the ASCII regexes don't treat as \s runs on the str ones
+        is_ascii = text.isascii() and not _ASCII_NARROW_SPACE.search(text)
+        regexes = self._pattern_ascii_regexes if is_ascii else self._pattern_regexes
+        # Encoded once for Hyperscan and every bytes regex; ASCII byte offsets are
+        # character offsets, so match positions index text unchanged
+        data = text.encode('ascii') if is_ascii else None
+        
+        candidates = self._candidate_patterns(text, data)
+        if critical_only:
+            candidates = [index for index in candidates if self._pattern_severities[index] == DetectionLevel.CRITICAL]
         
-        for pattern_name, pattern_config in self.custom_patterns.items():
+        for index in candidates:
+            pattern_name = self._pattern_names[index]
             try:
-                pattern = pattern_config['pattern']
-                confidence = pattern_config['confidence']
-                severity = pattern_config['severity']
+                regex = regexes[index]
+                if regex is None:
+                    continue
+                confidence = self._pattern_confidences[index]
+                severity = self._pattern_severities[index]
+                validator = self._pattern_validators[index]
+                context_required = self._pattern_contexts[index]
+                description = self._pattern_descriptions[index]
                 
-                matches = re.finditer(pattern, text, re.IGNORECASE)
+                on_bytes = is_ascii and self._pattern_ascii_bytes[index]
+                matches = regex.finditer(data if on_bytes else text)
                 
                 for match in matches:
                     # Apply validator if available
-                    validator = pattern_config.get('validator')
-                    if validator and not validator(match.group()):
-                        continue
+                    if validator:
+                        matched = match.group()
+                        if not validator(matched.decode('ascii') if on_bytes else matched):
+                            continue
                     
                     # Check context requirements
-                    context_required = pattern_config.get('context_required', [])
                     if context_required:
-                        context_text = text[max(0, match.start()-50):match.end()+50].lower()
-                        if not any(ctx in context_text for ctx in context_required):
+                        window_start, window_end = max(0, match.start()-50), match.end()+50
+                        if is_ascii:
+                            # ASCII lower-casing is per character, so one lowered copy of
+                            # the text can be searched in place of each lowered window
+                            if lowered is None:
+                                lowered = text.lower()
+                            has_context = any(lowered.find(ctx, window_start, window_end) != -1 for ctx in context_required)
+                        else:
+                            context_text = text[window_start:window_end].lower()
+                            has_context = any(ctx in context_text for ctx in context_required)
+                        if not has_context:
                             confidence *= 0.5  # Reduce confidence without context
                     
                     issue = SecurityIssue(
                         type=pattern_name,
-                        description=f"Custom pattern detected {pattern_name}",
+                        description=description,
                         confidence=confidence,
                         location=(match.start(), match.end()),
                         severity=severity,
@@ -332,23 +651,27 @@ class AdvancedSecurityDetector:
                         detector="custom_regex"
                     )
                     issues.append(issue)
+                    if critical_only:
+                        return issues
                     
             except Exception as e:
                 self.logger.error(f"Error in custom pattern {pattern_name}: {e}")
         
         return issues
     
-    async def _context_aware_scan(self, text: str, context: Dict) -> List[SecurityIssue]:
+    async def _context_aware_scan(self, text: str, context: Dict, lowered: Optional[str] = None) -> List[SecurityIssue]:
         """Context-aware detection based on request metadata"""
         issues = []
+        if lowered is None:
+            lowered = text.lower()
         
         # Check for suspicious patterns based on context
         user_id = context.get('user_id')
         request_type = context.get('request_type')
         
         # Example: Detect potential data exfiltration attempts
-        if 'export' in text.lower() or 'download' in text.lower():
-            if any(pattern in text.lower() for pattern in ['database', 'users', 'passwords']):
+        if 'export' in lowered or 'download' in lowered:
+            if any(pattern in lowered for pattern in ('database', 'users', 'passwords')):
                 issue = SecurityIssue(
                     type="potential_data_exfiltration",
                     description="Potential data exfiltration attempt detected",
@@ -370,21 +693,22 @@ class AdvancedSecurityDetector:
         # Sort by location
         issues.sort(key=lambda x: x.location[0])
         
+        # Sweep in start order. Kept issues never overlap each other and all start
+        # at or before the current one, so only the last kept issue can overlap it.
+        # Its span is held in locals so the overlap test is two int comparisons.
         deduplicated = []
+        last_start = last_end = None
         for issue in issues:
-            # Check for overlaps with existing issues
-            overlapping = False
-            for existing in deduplicated:
-                if self._issues_overlap(issue, existing):
-                    # Keep the higher confidence issue
-                    if issue.confidence > existing.confidence:
-                        deduplicated.remove(existing)
-                        deduplicated.append(issue)
-                    overlapping = True
-                    break
+            start, end = issue.location
+            if deduplicated and start < last_end and last_start < end:
+                # Keep the higher confidence issue
+                if issue.confidence > deduplicated[-1].confidence:
+                    deduplicated[-1] = issue
+                    last_start, last_end = start, end
+                continue
             
-            if not overlapping:
-                deduplicated.append(issue)
+            deduplicated.append(issue)
+            last_start, last_end = start, end
         
         return deduplicated
     
@@ -397,34 +721,23 @@ class AdvancedSecurityDetector:
     
     def _confidence_to_severity(self, confidence: float) -> DetectionLevel:
         """Convert confidence score to severity level"""
-        if confidence >= DetectionLevel.CRITICAL.value:
-            return DetectionLevel.CRITICAL
-        elif confidence >= DetectionLevel.HIGH.value:
-            return DetectionLevel.HIGH
-        elif confidence >= DetectionLevel.MEDIUM.value:
-            return DetectionLevel.MEDIUM
-        else:
-            return DetectionLevel.LOW
+        return _SEVERITY_LEVELS[bisect.bisect_right(_SEVERITY_THRESHOLDS, confidence)]
     
     def _validate_credit_card(self, card_number: str) -> bool:
         """Validate credit card using Luhn algorithm"""
-        # Remove spaces and dashes
-        card_number = re.sub(r'[-\s]', '', card_number)
+        # Remove spaces and dashes (split() drops the same whitespace as \s)
+        card_number = "".join(card_number.replace('-', '').split())
         
         if not card_number.isdigit() or len(card_number) < 13:
             return False
         
-        # Luhn algorithm
-        total = 0
-        reverse_digits = card_number[::-1]
-        
-        for i, digit in enumerate(reverse_digits):
-            n = int(digit)
-            if i % 2 == 1:
-                n *= 2
-                if n > 9:
-                    n = n // 10 + n % 10
-            total += n
+        # Luhn algorithm: every second digit from the right is doubled. Negative-step
+        # slices walk the digits right to left without reversing the string first.
+        if not card_number.isascii():
+            card_number = "".join(str(int(digit)) for digit in card_number)
+        digits = card_number.encode('ascii')
+        total = (sum(digits[-1::-2].translate(_LUHN_DIGIT))
+                 + sum(digits[-2::-2].translate(_LUHN_DOUBLED)))
         
         return total % 10 == 0
     
@@ -434,8 +747,7 @@ class AdvancedSecurityDetector:
             return True  # Skip validation if library not available
         
         try:
-            import validators
-            return validators.email(email)
+            return _get_validators().email(email)
         except:
             return True
     
@@ -445,19 +757,16 @@ class AdvancedSecurityDetector:
             return True  # Skip validation if library not available
         
         try:
+            phonenumbers = _get_phonenumbers()
             parsed = phonenumbers.parse(phone, "US")
             return phonenumbers.is_valid_number(parsed)
         except:
             return False
     
-    def _update_performance_stats(self, scan_time: float):
-        """Update performance statistics"""
-        total_scans = self.detection_stats['total_scans']
-        current_avg = self.detection_stats['avg_scan_time']
-        
-        # Calculate new average
-        new_avg = ((current_avg * (total_scans - 1)) + scan_time) / total_scans
-        self.detection_stats['avg_scan_time'] = new_avg
+    def _update_performance_stats(self, scan_time_ns: int):
+        """Update performance statistics for scans that took scan_time_ns in total"""
+        # An integer total does not drift the way a re-weighted running average does
+        self.detection_stats['total_scan_time_ns'] += scan_time_ns
     
     def should_block_request(self, issues: List[SecurityIssue]) -> bool:
         """Determine if request should be blocked based on detected issues"""
@@ -511,4 +820,6 @@ class AdvancedSecurityDetector:
     
     def get_stats(self) -> Dict:
         """Get detection statistics"""
-        return self.detection_stats.copy()
+        stats = self.detection_stats.copy()
+        stats['avg_scan_time'] = stats['total_scan_time_ns'] / max(stats['total_scans'], 1) / 1e9
+        return stats
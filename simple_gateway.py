@@ -3,40 +3,94 @@ Ultra-Simple LLM Gateway for Railway
 Uses ONLY Python built-in modules - no external dependencies
 """
 import http.server
-import socketserver
 import json
 import re
 import os
 import time
 import uuid
+import hashlib
+import threading
+from collections import OrderedDict
 from urllib.request import Request, urlopen
 from urllib.error import HTTPError
 
+# Optional: RE2 matches in time linear in the input, so no prompt can make a
+# pattern backtrack. The gateway still runs on the standard library alone.
+try:
+    import re2
+    RE2_AVAILABLE = True
+except ImportError:
+    RE2_AVAILABLE = False
+
+# Optional: orjson parses request bodies from bytes and serializes straight to
+# bytes. Its decode errors subclass json.JSONDecodeError. Responses are compact
+# either way; the clients are programs, not people.
+try:
+    import orjson
+
+    def parse_json(body):
+        """Decode a JSON body from bytes"""
+        return orjson.loads(body)
+
+    def encode_json(data):
+        """Encode data as JSON bytes"""
+        return orjson.dumps(data)
+except ImportError:
+    def parse_json(body):
+        """Decode a JSON body from bytes"""
+        return json.loads(body.decode('utf-8'))
+
+    def encode_json(data):
+        """Encode data as JSON bytes"""
+        return json.dumps(data, separators=(',', ':')).encode()
+
+# Every byte except the ASCII digits, for bytes.translate's delete argument
+NON_DIGIT_BYTES = bytes(byte for byte in range(256) if byte not in b'0123456789')
+
+# ASCII whitespace to Python's str \s that the ASCII patterns' \s does not match:
+# bytes patterns leave out \x1c-\x1f, and RE2 also leaves out \v
+ASCII_NARROW_SPACE = re.compile('[\x0b\x1c-\x1f]')
+
+# Luhn lookup tables over ASCII digit bytes: a digit's value, and the digit sum of
+# twice its value
+LUHN_DIGIT = bytes.maketrans(b'0123456789', bytes(range(10)))
+LUHN_DOUBLED = bytes.maketrans(b'0123456789', bytes([0, 2, 4, 6, 8, 1, 3, 5, 7, 9]))
+
+# Deletes the separators a card match may contain: dashes and everything \s
+# matches, which is exactly str.isspace (the last such code point is U+3000)
+LUHN_STRIP = str.maketrans('', '', '-' + ''.join(c for c in map(chr, range(0x3001)) if c.isspace()))
+
 
 class EnhancedSecurityScanner:
     """Enhanced security scanner with multiple detection layers"""
 
     def __init__(self):
-        # Enhanced patterns with confidence scores
+        # Enhanced patterns with confidence scores. "anchor" is a lower-case literal
+        # every match contains; a pattern whose anchor is missing from the case-folded
+        # text is skipped without running its regex.
         self.patterns = {
             # High-confidence API key patterns
             "openai_api_key": {
                 "pattern": r'sk-[a-zA-Z0-9]{48}',
+                "anchor": "sk-",
                 "confidence": 0.98,
                 "severity": "CRITICAL"
             },
             "anthropic_api_key": {
                 "pattern": r'sk-ant-[a-zA-Z0-9\-_]{95}',
+                "anchor": "sk-ant-",
                 "confidence": 0.98,
                 "severity": "CRITICAL"
             },
             "github_token": {
                 "pattern": r'ghp_[a-zA-Z0-9]{36}',
+                "anchor": "ghp_",
                 "confidence": 0.95,
                 "severity": "CRITICAL"
             },
             "aws_access_key": {
                 "pattern": r'AKIA[0-9A-Z]{16}',
+                "anchor": "akia",
                 "confidence": 0.95,
                 "severity": "CRITICAL"
             },
@@ -44,6 +98,7 @@ class EnhancedSecurityScanner:
             # PII patterns with validation
             "email": {
                 "pattern": r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b',
+                "anchor": "@",
                 "confidence": 0.85,
                 "severity": "HIGH"
             },
@@ -54,6 +109,7 @@ class EnhancedSecurityScanner:
             },
             "ssn": {
                 "pattern": r'\b\d{3}-\d{2}-\d{4}\b',
+                "anchor": "-",
                 "confidence": 0.9,
                 "severity": "HIGH"
             },
@@ -66,11 +122,13 @@ class EnhancedSecurityScanner:
             # Database and connection strings
             "database_url": {
                 "pattern": r'(postgresql|mysql|mongodb)://[^:\s]+:[^@\s]+@[^:\s]+:\d+/\w+',
+                "anchor": "://",
                 "confidence": 0.9,
                 "severity": "CRITICAL"
             },
             "connection_string": {
                 "pattern": r'(Server|Host|Data Source)\s*=\s*[^;]+;\s*(Database|Initial Catalog)\s*=\s*[^;]+',
+                "anchor": "=",
                 "confidence": 0.85,
                 "severity": "HIGH"
             },
@@ -78,16 +136,19 @@ class EnhancedSecurityScanner:
             # Generic secrets with context
             "password_assignment": {
                 "pattern": r'password\s*[:=]\s*["\']?[a-zA-Z0-9!@#$%^&*()]{6,}["\']?',
+                "anchor": "password",
                 "confidence": 0.8,
                 "severity": "HIGH"
             },
             "secret_assignment": {
                 "pattern": r'secret\s*[:=]\s*["\']?[a-zA-Z0-9!@#$%^&*()]{8,}["\']?',
+                "anchor": "secret",
                 "confidence": 0.8,
                 "severity": "HIGH"
             },
             "api_key_assignment": {
                 "pattern": r'api[_-]?key\s*[:=]\s*["\']?[a-zA-Z0-9\-_]{16,}["\']?',
+                "anchor": "api",
                 "confidence": 0.75,
                 "severity": "HIGH"
             },
@@ -95,6 +156,7 @@ class EnhancedSecurityScanner:
             # JWT tokens
             "jwt_token": {
                 "pattern": r'eyJ[a-zA-Z0-9\-_]+\.[a-zA-Z0-9\-_]+\.[a-zA-Z0-9\-_]+',
+                "anchor": "eyj",
                 "confidence": 0.85,
                 "severity": "HIGH"
             },
@@ -102,6 +164,7 @@ class EnhancedSecurityScanner:
             # Private keys
             "private_key": {
                 "pattern": r'-----BEGIN [A-Z ]+PRIVATE KEY-----',
+                "anchor": "-----begin ",
                 "confidence": 0.99,
                 "severity": "CRITICAL"
             },
@@ -109,66 +172,154 @@ class EnhancedSecurityScanner:
             # IP addresses (internal networks)
             "private_ip": {
                 "pattern": r'\b(?:10\.|172\.(?:1[6-9]|2[0-9]|3[01])\.|192\.168\.)\d{1,3}\.\d{1,3}\b',
+                "anchor": ".",
                 "confidence": 0.6,
                 "severity": "MEDIUM"
             }
         }
 
-        # Compile patterns for performance
-        self.compiled_patterns = {}
-        for name, config in self.patterns.items():
-            self.compiled_patterns[name] = {
-                "regex": re.compile(config["pattern"], re.IGNORECASE),
-                "confidence": config["confidence"],
-                "severity": config["severity"]
-            }
+        # The digit-shaped patterns have no literal prefix for re to skip ahead
+        # with, so each one walks the whole text. Fused into one alternation they
+        # walk it once: no match means none of them matches, and otherwise none
+        # of them can match before where the alternation first did.
+        self.digit_patterns = ("phone_us", "ssn", "credit_card", "private_ip")
+
+        # Compile patterns for performance, into parallel tuples the scan loop zips
+        # over instead of looking each field up in a per-pattern dict
+        validators = {"credit_card": self._validate_luhn, "email": self._basic_email_validation}
+        names = tuple(self.patterns)
+        configs = [self.patterns[name] for name in names]
+        self.pattern_names = names
+        self.pattern_regexes = tuple(re.compile(config["pattern"], re.IGNORECASE) for config in configs)
+        self.pattern_ascii_regexes = tuple(self._compile_ascii(config["pattern"]) for config in configs)
+        self.pattern_confidences = tuple(config["confidence"] for config in configs)
+        self.pattern_severities = tuple(config["severity"] for config in configs)
+        self.pattern_anchors = tuple(config.get("anchor") for config in configs)
+        self.pattern_digit_gated = tuple(name in self.digit_patterns for name in names)
+        self.pattern_validators = tuple(validators.get(name) for name in names)
+
+        digit_alternation = "|".join(f"(?:{self.patterns[name]['pattern']})" for name in self.digit_patterns)
+        self.digit_gate = re.compile(digit_alternation, re.IGNORECASE)
+        self.ascii_digit_gate = self._compile_ascii(digit_alternation)
+
+        # LRU of recent results keyed by content digest; retries and replayed chat
+        # history resend the same text
+        self.cache = OrderedDict()
+        self.cache_size = 1024
+        # Request threads share the scanner; the regexes are safe to share but the
+        # LRU's reorder and evict steps are not
+        self.cache_lock = threading.Lock()
+
+    def _compile_ascii(self, pattern):
+        """Compile a pattern for ASCII text as a bytes pattern, with RE2 when it is installed"""
+        # RE2's \b, \d and case folding are ASCII-only, so non-ASCII text stays on re.
+        # ASCII text is matched as bytes: it is encoded once per scan, and bytes
+        # patterns use ASCII-only classes with no code point width to handle. Their
+        # \s is narrower than str's, though, so _scan keeps text containing
+        # ASCII_NARROW_SPACE characters on the str patterns.
+        encoded = pattern.encode('ascii')
+        if RE2_AVAILABLE:
+            try:
+                return re2.compile(b'(?i)' + encoded)
+            except re2.error as e:
+                print(f"RE2 rejected pattern, using re: {e}")
+        return re.compile(encoded, re.IGNORECASE)
 
     def scan(self, text):
-        """Enhanced scan with confidence scoring"""
+        """Enhanced scan with confidence scoring, serving recently seen text from the cache"""
+        key = hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+        with self.cache_lock:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.cache.move_to_end(key)
+                return list(cached)
+
+        issues = self._scan(text)
+        with self.cache_lock:
+            self.cache[key] = tuple(issues)
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return issues
+
+    def _scan(self, text):
+        """Run the patterns over text"""
         issues = []
+        # Text with whitespace the ASCII patterns don't treat as \s runs on the str ones
+        is_ascii = text.isascii() and not ASCII_NARROW_SPACE.search(text)
+        regexes = self.pattern_ascii_regexes if is_ascii else self.pattern_regexes
+        digit_gate = self.ascii_digit_gate if is_ascii else self.digit_gate
+        # ASCII byte offsets are character offsets, so locations index text unchanged
+        subject = text.encode('ascii') if is_ascii else text
+
+        # IGNORECASE also matches i against dotless ı and dotted İ, which casefold
+        # leaves as ı and i + U+0307
+        folded = text.casefold().replace('\u0131', 'i').replace('\u0307', '')
+        # Deleting every non-digit byte is one C pass; \d also matches non-ASCII
+        # digits, so other text always goes on to the digit gate
+        if is_ascii and not subject.translate(None, NON_DIGIT_BYTES):
+            digit_start = -1
+        else:
+            digit_start = None
+
+        patterns = zip(self.pattern_names, regexes, self.pattern_confidences, self.pattern_severities,
+                       self.pattern_anchors, self.pattern_digit_gated, self.pattern_validators)
+        for name, regex, confidence, severity, anchor, digit_gated, validator in patterns:
+            if anchor is not None and anchor not in folded:
+                continue
+
+            start = 0
+            if digit_gated:
+                if digit_start is None:
+                    gate_match = digit_gate.search(subject)
+                    digit_start = gate_match.start() if gate_match else -1
+                if digit_start < 0:
+                    continue
+                start = digit_start
 
-        for name, config in self.compiled_patterns.items():
-            matches = config["regex"].finditer(text)
+            matches = regex.finditer(subject, start)
 
             for match in matches:
+                matched = match.group()
+                if is_ascii:
+                    matched = matched.decode('ascii')
                 # Additional validation for specific patterns
-                if name == "credit_card" and not self._validate_luhn(match.group()):
-                    continue
-
-                if name == "email" and not self._basic_email_validation(match.group()):
+                if validator and not validator(matched):
                     continue
 
+                # No surrounding context is sliced here; get_context builds it from
+                # the location for the callers that show it
                 issue = {
                     "type": name,
-                    "confidence": config["confidence"],
-                    "severity": config["severity"],
-                    "match": match.group(),
-                    "location": (match.start(), match.end()),
-                    "context": text[max(0, match.start()-20):match.end()+20]
+                    "confidence": confidence,
+                    "severity": severity,
+                    "match": matched,
+                    "location": match.span()
                 }
                 issues.append(issue)
 
         return issues
 
+    @staticmethod
+    def get_context(text, issue):
+        """Text around an issue: the match plus up to 20 characters either side"""
+        start, end = issue["location"]
+        return text[max(0, start-20):end+20]
+
     def _validate_luhn(self, card_number):
         """Basic Luhn algorithm validation for credit cards"""
         # Remove spaces and dashes
-        card_number = re.sub(r'[-\s]', '', card_number)
+        card_number = card_number.translate(LUHN_STRIP)
 
         if not card_number.isdigit() or len(card_number) < 13:
             return False
 
-        # Luhn algorithm
-        total = 0
-        reverse_digits = card_number[::-1]
-
-        for i, digit in enumerate(reverse_digits):
-            n = int(digit)
-            if i % 2 == 1:
-                n *= 2
-                if n > 9:
-                    n = n // 10 + n % 10
-            total += n
+        # Luhn algorithm: every second digit from the right is doubled, so the two
+        # halves are summed through their own table with bytes.translate
+        if not card_number.isascii():
+            card_number = "".join(str(int(digit)) for digit in card_number)
+        digits = card_number.encode('ascii')
+        total = (sum(digits[-1::-2].translate(LUHN_DIGIT))
+                 + sum(digits[-2::-2].translate(LUHN_DOUBLED)))
 
         return total % 10 == 0
 
@@ -205,6 +356,25 @@ class EnhancedSecurityScanner:
         return False
 
 
+# Built once per process and shared by every request
+_SCANNER = EnhancedSecurityScanner()
+
+# (unix second, its log-line form); rebuilt at most once a second. Request threads
+# replace the whole tuple, so a reader never sees a second paired with another's text.
+_log_stamp = (0, "")
+
+
+def log_timestamp():
+    """Current unix second and its 'YYYY-MM-DD HH:MM:SS' local-time form"""
+    global _log_stamp
+    now = int(time.time())
+    stamp = _log_stamp
+    if stamp[0] != now:
+        stamp = (now, time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now)))
+        _log_stamp = stamp
+    return stamp
+
+
 class SimpleGatewayHandler(http.server.BaseHTTPRequestHandler):
     """Simple HTTP handler"""
 
@@ -311,20 +481,33 @@ class SimpleGatewayHandler(http.server.BaseHTTPRequestHandler):
                 return
 
             post_data = self.rfile.read(content_length)
-            request_data = json.loads(post_data.decode('utf-8'))
+            request_data = parse_json(post_data)
 
-            # Extract text
-            text_content = ""
+            # Extract text: each message followed by a space, built in one join
+            # rather than by repeated concatenation
             messages = request_data.get('messages', [])
-            for msg in messages:
-                text_content += msg.get('content', '') + " "
-
-            # Security scan
-            scanner = EnhancedSecurityScanner()
-            issues = scanner.scan(text_content)
+            contents = [msg.get('content', '') for msg in messages]
+            text_content = "".join([content + " " for content in contents])
+
+            # Replayed history repeats system and assistant messages; each distinct
+            # content is scanned once, in first-seen order
+            unique_contents = dict.fromkeys(contents)
+            if len(unique_contents) == len(contents):
+                scan_text = text_content
+            else:
+                scan_text = "".join([content + " " for content in unique_contents])
+
+            # Security scan. Every pattern needs a non-space character, so empty and
+            # whitespace-only content (no messages, tool-call-only turns) skips it.
+            scanner = _SCANNER
+            if not scan_text or scan_text.isspace():
+                issues = []
+            else:
+                issues = scanner.scan(scan_text)
 
             # Log request
-            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] Chat request")
+            now, stamp = log_timestamp()
+            print(f"[{stamp}] Chat request")
             print(f"  Content: {text_content[:100]}...")
             print(f"  Issues found: {len(issues)}")
 
@@ -336,36 +519,48 @@ class SimpleGatewayHandler(http.server.BaseHTTPRequestHandler):
             should_block = scanner.should_block(issues)
 
             if should_block:
+                # Counts, types and the per-issue list all come from one pass
+                critical_count = high_count = 0
+                issue_types = set()
+                issue_list = []
+                for issue in issues:
+                    severity = issue["severity"]
+                    if severity == "CRITICAL":
+                        critical_count += 1
+                    elif severity == "HIGH":
+                        high_count += 1
+                    issue_types.add(issue["type"])
+                    issue_list.append({
+                        "type": issue["type"],
+                        "severity": severity,
+                        "confidence": issue["confidence"],
+                        "description": f"Detected {issue['type'].replace('_', ' ')}"
+                    })
+
                 # Create detailed error response
                 error_response = {
                     "error": "Request blocked due to security policy violations",
                     "blocked": True,
-                    "timestamp": int(time.time()),
+                    "timestamp": now,
                     "detection_summary": {
                         "total_issues": len(issues),
-                        "critical_issues": len([i for i in issues if i["severity"] == "CRITICAL"]),
-                        "high_severity_issues": len([i for i in issues if i["severity"] == "HIGH"]),
-                        "issue_types": list(set(i["type"] for i in issues))
+                        "critical_issues": critical_count,
+                        "high_severity_issues": high_count,
+                        "issue_types": list(issue_types)
                     },
-                    "issues": [
-                        {
-                            "type": issue["type"],
-                            "severity": issue["severity"],
-                            "confidence": issue["confidence"],
-                            "description": f"Detected {issue['type'].replace('_', ' ')}"
-                        }
-                        for issue in issues
-                    ]
+                    "issues": issue_list
                 }
                 print(f"  BLOCKED: {len(issues)} security issues detected")
                 self.send_json(error_response, 400)
                 return
 
-            # Mock successful response
+            # Mock successful response. split() is the cheapest exact word count:
+            # counting spaces would also count the separators after each message.
+            prompt_tokens = len(text_content.split())
             response = {
                 "id": f"mock-{uuid.uuid4().hex[:8]}",
                 "object": "chat.completion",
-                "created": int(time.time()),
+                "created": now,
                 "model": "mock-gateway",
                 "choices": [{
                     "index": 0,
@@ -376,9 +571,9 @@ class SimpleGatewayHandler(http.server.BaseHTTPRequestHandler):
                     "finish_reason": "stop"
                 }],
                 "usage": {
-                    "prompt_tokens": len(text_content.split()),
+                    "prompt_tokens": prompt_tokens,
                     "completion_tokens": 20,
-                    "total_tokens": len(text_content.split()) + 20
+                    "total_tokens": prompt_tokens + 20
                 }
             }
 
@@ -393,11 +588,13 @@ class SimpleGatewayHandler(http.server.BaseHTTPRequestHandler):
 
     def send_json(self, data, status=200):
         """Send JSON response"""
+        body = encode_json(data)
         self.send_response(status)
         self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
         self.send_header('Access-Control-Allow-Origin', '*')
         self.end_headers()
-        self.wfile.write(json.dumps(data, indent=2).encode())
+        self.wfile.write(body)
 
     def log_message(self, format, *args):
         """Suppress default logs"""
@@ -429,7 +626,9 @@ def main():
     print("=" * 40)
 
     try:
-        with socketserver.TCPServer((HOST, PORT), SimpleGatewayHandler) as httpd:
+        # One thread per connection, so a slow client or a long scan does not
+        # hold up every other request
+        with http.server.ThreadingHTTPServer((HOST, PORT), SimpleGatewayHandler) as httpd:
             print(f"Server running on port {PORT}")
             print("Gateway is ready!")
             httpd.serve_forever()
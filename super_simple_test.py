@@ -3,49 +3,71 @@ Super simple test that demonstrates the gateway concepts
 without any imports that might conflict
 """
 
+# Lower-case keywords and the tag each one reports, built once at import
+KEYWORD_MENTIONS = (
+    ("api_key", "api_key_mention"),
+    ("password", "password_mention"),
+)
+
+# Shorter text cannot contain any keyword, even after lower-casing
+MIN_KEYWORD_LENGTH = min(len(keyword) for keyword, _ in KEYWORD_MENTIONS)
+
+
 def detect_secrets(text):
     """Simple secret detection without regex"""
     secrets_found = []
 
-    # Simple string checks
+    # Simple string checks; the keyword checks share one lower-cased copy
     if "sk-" in text and len(text) > 50:
         secrets_found.append("potential_openai_key")
 
     if "@" in text and "." in text:
         secrets_found.append("potential_email")
 
-    if "api_key" in text.lower():
-        secrets_found.append("api_key_mention")
+    if len(text) < MIN_KEYWORD_LENGTH:
+        return secrets_found
+
+    lowered = text.lower()
 
-    if "password" in text.lower():
-        secrets_found.append("password_mention")
+    for keyword, tag in KEYWORD_MENTIONS:
+        if keyword in lowered:
+            secrets_found.append(tag)
 
     return secrets_found
 
 
-def process_chat_request(messages):
-    """Process a chat request with security checks"""
-    print("🔍 Processing chat request...")
+def line_collector(lines):
+    """Return a print-like function that appends each line to lines"""
+    def log(*args):
+        """Append args joined by spaces as one line, like print"""
+        lines.append(" ".join(str(arg) for arg in args) + "\n")
+    return log
+
 
-    # Extract text content
-    full_text = ""
-    for msg in messages:
-        full_text += msg.get("content", "") + " "
+def process_chat_request(messages, log=print):
+    """Process a chat request with security checks"""
+    log("🔍 Processing chat request...")
 
-    print(f"📝 Content length: {len(full_text)} characters")
+    # Content length counts each message followed by a space
+    contents = [msg.get("content", "") for msg in messages]
+    log(f"📝 Content length: {sum(len(c) + 1 for c in contents)} characters")
 
-    # Security scan
-    security_issues = detect_secrets(full_text)
+    # Security scan, one message at a time; stop at the first hit
+    security_issues = []
+    for content in contents:
+        security_issues = detect_secrets(content)
+        if security_issues:
+            break
 
     if security_issues:
-        print(f"🚨 Security issues detected: {security_issues}")
+        log(f"🚨 Security issues detected: {security_issues}")
         return {
             "error": "Request blocked",
             "issues": security_issues,
             "blocked": True
         }
     else:
-        print("✅ Security scan passed")
+        log("✅ Security scan passed")
         return {
             "id": "test-123",
             "choices": [{
@@ -59,10 +81,10 @@ def process_chat_request(messages):
         }
 
 
-def simulate_http_server():
+def simulate_http_server(log=print):
     """Simulate HTTP server responses"""
-    print("\n🌐 Simulating HTTP Server Responses")
-    print("-" * 40)
+    log("\n🌐 Simulating HTTP Server Responses")
+    log("-" * 40)
 
     # Simulate health endpoint
     health_response = {
@@ -74,23 +96,27 @@ def simulate_http_server():
             "deepseek_provider": False  # Mock mode
         }
     }
-    print("GET /health ->", health_response)
+    log("GET /health ->", health_response)
 
     # Simulate chat endpoint with clean request
     clean_request = {"messages": [{"role": "user", "content": "Hello!"}]}
-    clean_response = process_chat_request(clean_request["messages"])
-    print("POST /v1/chat/completions (clean) ->", clean_response)
+    clean_response = process_chat_request(clean_request["messages"], log)
+    log("POST /v1/chat/completions (clean) ->", clean_response)
 
     # Simulate chat endpoint with blocked request
     blocked_request = {"messages": [{"role": "user", "content": "My email is test@example.com"}]}
-    blocked_response = process_chat_request(blocked_request["messages"])
-    print("POST /v1/chat/completions (blocked) ->", blocked_response)
+    blocked_response = process_chat_request(blocked_request["messages"], log)
+    log("POST /v1/chat/completions (blocked) ->", blocked_response)
 
 
 def main():
     """Test the gateway logic"""
-    print("🚀 LLM Gateway Logic Test")
-    print("=" * 40)
+    # Collect the report and write it with a single print at the end
+    lines = []
+    log = line_collector(lines)
+
+    log("🚀 LLM Gateway Logic Test")
+    log("=" * 40)
 
     # Test cases
     test_cases = [
@@ -113,40 +139,42 @@ def main():
     ]
 
     for i, test_case in enumerate(test_cases, 1):
-        print(f"\n{i}. Testing: {test_case['name']}")
-        print("-" * 30)
+        log(f"\n{i}. Testing: {test_case['name']}")
+        log("-" * 30)
 
-        result = process_chat_request(test_case["messages"])
+        result = process_chat_request(test_case["messages"], log)
 
         if result["blocked"]:
-            print(f"❌ Request blocked: {result['issues']}")
+            log(f"❌ Request blocked: {result['issues']}")
         else:
-            print(f"✅ Request allowed: {result['choices'][0]['message']['content']}")
+            log(f"✅ Request allowed: {result['choices'][0]['message']['content']}")
 
-    print("\n" + "=" * 40)
-    print("🏁 Gateway logic test completed!")
-    print("\nKey Features Demonstrated:")
-    print("  ✅ Content extraction from messages")
-    print("  ✅ Security scanning (PII/secrets)")
-    print("  ✅ Request blocking on detection")
-    print("  ✅ Mock LLM response generation")
-    print("  ✅ Audit logging")
+    log("\n" + "=" * 40)
+    log("🏁 Gateway logic test completed!")
+    log("\nKey Features Demonstrated:")
+    log("  ✅ Content extraction from messages")
+    log("  ✅ Security scanning (PII/secrets)")
+    log("  ✅ Request blocking on detection")
+    log("  ✅ Mock LLM response generation")
+    log("  ✅ Audit logging")
 
     # Simulate HTTP server
-    simulate_http_server()
-
-    print("\n" + "=" * 50)
-    print("🎉 LLM Gateway MVP Demonstration Complete!")
-    print("\n📋 Summary:")
-    print("  ✅ Core gateway logic working")
-    print("  ✅ Security detection functional")
-    print("  ✅ Request blocking operational")
-    print("  ✅ API endpoints simulated")
-    print("\n💡 Next Steps:")
-    print("  1. Fix Python environment OR use Docker")
-    print("  2. Add real DeepSeek API integration")
-    print("  3. Deploy to cloud platform")
-    print("  4. Add authentication & rate limiting")
+    simulate_http_server(log)
+
+    log("\n" + "=" * 50)
+    log("🎉 LLM Gateway MVP Demonstration Complete!")
+    log("\n📋 Summary:")
+    log("  ✅ Core gateway logic working")
+    log("  ✅ Security detection functional")
+    log("  ✅ Request blocking operational")
+    log("  ✅ API endpoints simulated")
+    log("\n💡 Next Steps:")
+    log("  1. Fix Python environment OR use Docker")
+    log("  2. Add real DeepSeek API integration")
+    log("  3. Deploy to cloud platform")
+    log("  4. Add authentication & rate limiting")
+
+    print("".join(lines), end="")
 
 
 if __name__ == "__main__":
@@ -1,105 +1,214 @@
 """
 Simple test script for the LLM Gateway MVP
+
+Set LOAD_ROUNDS to a positive number to follow the checks with a load run
+that sends every probe that many times concurrently.
 """
 import asyncio
+import functools
 import httpx
 import json
+import os
+import time
+
+# Optional: orjson encodes straight to bytes and decodes from bytes
+try:
+    import orjson
+
+    def parse_json(body):
+        """Decode a JSON body from bytes"""
+        return orjson.loads(body)
+
+    def encode_json(data):
+        """Encode data as JSON bytes"""
+        return orjson.dumps(data)
+except ImportError:
+    def parse_json(body):
+        """Decode a JSON body from bytes"""
+        return json.loads(body)
+
+    def encode_json(data):
+        """Encode data as JSON bytes"""
+        return json.dumps(data).encode()
+
+# Optional: h2 lets httpx multiplex the probes over one HTTP/2 connection
+# when the gateway is served over TLS
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Optional: uvloop's libuv event loop (shipped with uvicorn[standard])
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+BASE_URL = "http://localhost:8000"
+LOAD_ROUNDS = int(os.getenv("LOAD_ROUNDS", "0"))
+LOAD_CONNECTIONS = int(os.getenv("LOAD_CONNECTIONS", "50"))
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+def chat_body(content):
+    """Encode a single-message chat completion request"""
+    return encode_json({
+        "model": "deepseek-chat",
+        "messages": [
+            {"role": "user", "content": content}
+        ],
+        "temperature": 0.7,
+        "max_tokens": 100
+    })
+
+
+def report_health(response):
+    """Print the health check details"""
+    health_data = parse_json(response.content)
+    print("✅ Health check passed")
+    print(f"   Status: {health_data['status']}")
+    print(f"   Components: {health_data['components']}")
+
+
+def report_health_failure(response):
+    """Print a failed health check"""
+    print(f"❌ Health check failed: {response.status_code}")
+
+
+def report_chat(response):
+    """Print the reply and token usage of a successful chat request"""
+    chat_data = parse_json(response.content)
+    print("✅ Normal chat request successful")
+    print(f"   Response: {chat_data['choices'][0]['message']['content'][:100]}...")
+    print(f"   Tokens used: {chat_data['usage']['total_tokens']}")
+
+
+def report_chat_failure(response):
+    """Print a failed chat request and its error body"""
+    print(f"❌ Chat request failed: {response.status_code}")
+    print(f"   Error: {response.text}")
+
+
+def report_blocked(label, response):
+    """Print the issues that got a request blocked"""
+    error_data = parse_json(response.content)
+    print(f"✅ {label} detection working - request blocked")
+    print(f"   Issues detected: {error_data['detail']['issues']}")
+
+
+def report_not_blocked(label, response):
+    """Warn that a request expected to be blocked was not"""
+    print(f"⚠️  {label} detection may not be working: {response.status_code}")
+
+
+# (heading, error label, method, path, encoded body, expected status,
+#  report on expected status, report otherwise)
+TESTS = [
+    ("Health Check", "Health check", "GET", "/health", None, 200,
+     report_health, report_health_failure),
+    ("Normal Chat Request", "Chat request", "POST", "/v1/chat/completions",
+     chat_body("Hello! Can you help me write a simple Python function?"), 200,
+     report_chat, report_chat_failure),
+    ("PII Detection", "PII test", "POST", "/v1/chat/completions",
+     chat_body("My email is john.doe@example.com and my phone is 555-123-4567. Can you help me?"), 400,
+     functools.partial(report_blocked, "PII"), functools.partial(report_not_blocked, "PII")),
+    ("Secret Detection", "Secret test", "POST", "/v1/chat/completions",
+     chat_body("Here's my API key: sk-1234567890abcdef1234567890abcdef12345678. Can you help me use it?"), 400,
+     functools.partial(report_blocked, "Secret"), functools.partial(report_not_blocked, "Secret")),
+]
+
+
+async def probe(client, spec):
+    """Send one test's request and return the response"""
+    _, _, method, path, body, _, _, _ = spec
+    headers = JSON_HEADERS if body is not None else None
+    return await client.request(method, f"{BASE_URL}{path}", content=body, headers=headers)
 
 
 async def test_gateway():
     """Test the gateway functionality"""
-    base_url = "http://localhost:8000"
-    
     print("🧪 Testing LLM Gateway MVP")
     print("=" * 50)
     
-    async with httpx.AsyncClient() as client:
-        
-        # Test 1: Health Check
-        print("\n1. Testing Health Check...")
-        try:
-            response = await client.get(f"{base_url}/health")
-            if response.status_code == 200:
-                health_data = response.json()
-                print("✅ Health check passed")
-                print(f"   Status: {health_data['status']}")
-                print(f"   Components: {health_data['components']}")
-            else:
-                print(f"❌ Health check failed: {response.status_code}")
-        except Exception as e:
-            print(f"❌ Health check error: {e}")
-        
-        # Test 2: Normal Chat Request
-        print("\n2. Testing Normal Chat Request...")
-        try:
-            chat_request = {
-                "model": "deepseek-chat",
-                "messages": [
-                    {"role": "user", "content": "Hello! Can you help me write a simple Python function?"}
-                ],
-                "temperature": 0.7,
-                "max_tokens": 100
-            }
-            
-            response = await client.post(f"{base_url}/v1/chat/completions", json=chat_request)
-            if response.status_code == 200:
-                chat_data = response.json()
-                print("✅ Normal chat request successful")
-                print(f"   Response: {chat_data['choices'][0]['message']['content'][:100]}...")
-                print(f"   Tokens used: {chat_data['usage']['total_tokens']}")
-            else:
-                print(f"❌ Chat request failed: {response.status_code}")
-                print(f"   Error: {response.text}")
-        except Exception as e:
-            print(f"❌ Chat request error: {e}")
-        
-        # Test 3: Request with PII (should be blocked)
-        print("\n3. Testing PII Detection...")
-        try:
-            pii_request = {
-                "model": "deepseek-chat",
-                "messages": [
-                    {"role": "user", "content": "My email is john.doe@example.com and my phone is 555-123-4567. Can you help me?"}
-                ],
-                "temperature": 0.7,
-                "max_tokens": 100
-            }
-            
-            response = await client.post(f"{base_url}/v1/chat/completions", json=pii_request)
-            if response.status_code == 400:
-                error_data = response.json()
-                print("✅ PII detection working - request blocked")
-                print(f"   Issues detected: {error_data['detail']['issues']}")
-            else:
-                print(f"⚠️  PII detection may not be working: {response.status_code}")
-        except Exception as e:
-            print(f"❌ PII test error: {e}")
-        
-        # Test 4: Request with Secrets (should be blocked)
-        print("\n4. Testing Secret Detection...")
+    # One pooled client for every probe, sized so the concurrent probes
+    # never wait for a connection and are all kept alive afterwards
+    limits = httpx.Limits(max_connections=len(TESTS), max_keepalive_connections=len(TESTS))
+    async with httpx.AsyncClient(http2=HTTP2_AVAILABLE, limits=limits) as client:
+        # The probes are independent, so send them all at once and report
+        # the results in order; a failed request comes back as its exception
+        results = await asyncio.gather(
+            *(probe(client, spec) for spec in TESTS),
+            return_exceptions=True
+        )
+    
+    for number, (spec, result) in enumerate(zip(TESTS, results), 1):
+        heading, error_label, _, _, _, expected_status, on_expected, on_unexpected = spec
+        print(f"\n{number}. Testing {heading}...")
         try:
-            secret_request = {
-                "model": "deepseek-chat",
-                "messages": [
-                    {"role": "user", "content": "Here's my API key: sk-1234567890abcdef1234567890abcdef12345678. Can you help me use it?"}
-                ],
-                "temperature": 0.7,
-                "max_tokens": 100
-            }
-            
-            response = await client.post(f"{base_url}/v1/chat/completions", json=secret_request)
-            if response.status_code == 400:
-                error_data = response.json()
-                print("✅ Secret detection working - request blocked")
-                print(f"   Issues detected: {error_data['detail']['issues']}")
+            if isinstance(result, BaseException):
+                raise result
+            if result.status_code == expected_status:
+                on_expected(result)
             else:
-                print(f"⚠️  Secret detection may not be working: {response.status_code}")
+                on_unexpected(result)
         except Exception as e:
-            print(f"❌ Secret test error: {e}")
+            print(f"❌ {error_label} error: {e}")
     
     print("\n" + "=" * 50)
     print("🏁 Testing completed!")
 
 
+async def timed_probe(client, spec, latencies, failures):
+    """Send one probe, recording its latency or counting it as failed"""
+    heading, _, _, _, _, expected_status, _, _ = spec
+    start = time.perf_counter()
+    try:
+        response = await probe(client, spec)
+    except Exception:
+        failures[heading] += 1
+        return
+    latencies[heading].append(time.perf_counter() - start)
+    if response.status_code != expected_status:
+        failures[heading] += 1
+
+
+async def run_load(rounds):
+    """Send every probe `rounds` times concurrently and report latencies"""
+    print(f"\n⏱️  Load test: {rounds} rounds x {len(TESTS)} probes")
+    latencies = {spec[0]: [] for spec in TESTS}
+    failures = dict.fromkeys(latencies, 0)
+    
+    limits = httpx.Limits(max_connections=LOAD_CONNECTIONS, max_keepalive_connections=LOAD_CONNECTIONS)
+    async with httpx.AsyncClient(http2=HTTP2_AVAILABLE, limits=limits) as client:
+        start = time.perf_counter()
+        async with asyncio.TaskGroup() as tg:
+            for _ in range(rounds):
+                for spec in TESTS:
+                    tg.create_task(timed_probe(client, spec, latencies, failures))
+        elapsed = time.perf_counter() - start
+    
+    total = rounds * len(TESTS)
+    print(f"   {total} requests in {elapsed:.2f}s ({total / elapsed:.0f} req/s)")
+    for heading, samples in latencies.items():
+        if not samples:
+            print(f"   {heading}: no responses, {failures[heading]} failed")
+            continue
+        samples.sort()
+        p50 = samples[len(samples) // 2] * 1000
+        p95 = samples[min(len(samples) - 1, len(samples) * 95 // 100)] * 1000
+        print(f"   {heading}: p50 {p50:.1f} ms, p95 {p95:.1f} ms, "
+              f"max {samples[-1] * 1000:.1f} ms, {failures[heading]} failed")
+
+
+async def main():
+    """Run the checks, then the load test when LOAD_ROUNDS is set"""
+    await test_gateway()
+    if LOAD_ROUNDS > 0:
+        await run_load(LOAD_ROUNDS)
+
+
 if __name__ == "__main__":
-    asyncio.run(test_gateway())
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    asyncio.run(main())
@@ -1,15 +1,75 @@
 """
 Test script for the minimal gateway
 """
-import urllib.request
-import urllib.parse
+import http.client
 import json
 import time
 
+# Optional: orjson encodes straight to bytes and decodes from bytes
+try:
+    import orjson
+
+    def parse_json(body):
+        """Decode a JSON body from bytes"""
+        return orjson.loads(body)
+
+    def encode_json(data):
+        """Encode data as JSON bytes"""
+        return orjson.dumps(data)
+except ImportError:
+    def parse_json(body):
+        """Decode a JSON body from bytes"""
+        return json.loads(body.decode())
+
+    def encode_json(data):
+        """Encode data as JSON bytes"""
+        return json.dumps(data).encode()
+
+
+GATEWAY_HOST = "localhost"
+GATEWAY_PORT = 8000
+
+# Request bodies are static, so they are encoded once at import
+NORMAL_CHAT_BODY = encode_json({
+    "model": "deepseek-chat",
+    "messages": [
+        {"role": "user", "content": "Hello! Can you help me write a Python function?"}
+    ]
+})
+
+PII_CHAT_BODY = encode_json({
+    "model": "deepseek-chat",
+    "messages": [
+        {"role": "user", "content": "My email is john.doe@example.com and my phone is 555-123-4567"}
+    ]
+})
+
+SECRET_CHAT_BODY = encode_json({
+    "model": "deepseek-chat",
+    "messages": [
+        {"role": "user", "content": "Here's my API key: sk-1234567890abcdef1234567890abcdef12345678"}
+    ]
+})
+
+
+def post_chat(conn, request_body):
+    """POST an encoded chat request on the shared connection and return (status, body)"""
+    conn.request(
+        "POST",
+        "/v1/chat/completions",
+        body=request_body,
+        headers={'Content-Type': 'application/json'}
+    )
+    response = conn.getresponse()
+    # The body must be read before the connection can be used again
+    return response.status, response.read()
+
 
 def test_gateway():
     """Test the minimal gateway"""
-    base_url = "http://localhost:8000"
+    # One connection for every probe; http.client reopens it by itself if
+    # the server closes it after a response
+    conn = http.client.HTTPConnection(GATEWAY_HOST, GATEWAY_PORT)
     
     print("🧪 Testing Minimal LLM Gateway")
     print("=" * 50)
@@ -17,16 +77,19 @@ def test_gateway():
     # Test 1: Health Check
     print("\n1. Testing Health Check...")
     try:
-        with urllib.request.urlopen(f"{base_url}/health") as response:
-            if response.status == 200:
-                data = json.loads(response.read().decode())
-                print("✅ Health check passed")
-                print(f"   Status: {data['status']}")
-                print(f"   Version: {data['version']}")
-                print(f"   Components: {data['components']}")
-            else:
-                print(f"❌ Health check failed: {response.status}")
+        conn.request("GET", "/health")
+        response = conn.getresponse()
+        body = response.read()
+        if response.status == 200:
+            data = parse_json(body)
+            print("✅ Health check passed")
+            print(f"   Status: {data['status']}")
+            print(f"   Version: {data['version']}")
+            print(f"   Components: {data['components']}")
+        else:
+            print(f"❌ Health check failed: {response.status}")
     except Exception as e:
+        conn.close()
         print(f"❌ Health check error: {e}")
         print("   Make sure the gateway is running: py minimal_gateway.py")
         return
@@ -34,96 +97,52 @@ def test_gateway():
     # Test 2: Normal Chat Request
     print("\n2. Testing Normal Chat Request...")
     try:
-        request_data = {
-            "model": "deepseek-chat",
-            "messages": [
-                {"role": "user", "content": "Hello! Can you help me write a Python function?"}
-            ]
-        }
-        
-        data = json.dumps(request_data).encode()
-        req = urllib.request.Request(
-            f"{base_url}/v1/chat/completions",
-            data=data,
-            headers={'Content-Type': 'application/json'}
-        )
-        
-        with urllib.request.urlopen(req) as response:
-            if response.status == 200:
-                result = json.loads(response.read().decode())
-                print("✅ Normal chat request successful")
-                print(f"   Response: {result['choices'][0]['message']['content'][:100]}...")
-                print(f"   Tokens: {result['usage']['total_tokens']}")
-            else:
-                print(f"❌ Chat request failed: {response.status}")
+        status, body = post_chat(conn, NORMAL_CHAT_BODY)
+        if status == 200:
+            result = parse_json(body)
+            print("✅ Normal chat request successful")
+            print(f"   Response: {result['choices'][0]['message']['content'][:100]}...")
+            print(f"   Tokens: {result['usage']['total_tokens']}")
+        else:
+            print(f"❌ Chat request failed: {status}")
     except Exception as e:
         print(f"❌ Chat request error: {e}")
     
     # Test 3: Request with PII (should be blocked)
     print("\n3. Testing PII Detection...")
     try:
-        request_data = {
-            "model": "deepseek-chat",
-            "messages": [
-                {"role": "user", "content": "My email is john.doe@example.com and my phone is 555-123-4567"}
-            ]
-        }
-        
-        data = json.dumps(request_data).encode()
-        req = urllib.request.Request(
-            f"{base_url}/v1/chat/completions",
-            data=data,
-            headers={'Content-Type': 'application/json'}
-        )
-        
-        try:
-            with urllib.request.urlopen(req) as response:
-                result = json.loads(response.read().decode())
-                print("⚠️  PII detection may not be working - request went through")
-        except urllib.error.HTTPError as e:
-            if e.code == 400:
-                error_data = json.loads(e.read().decode())
-                print("✅ PII detection working - request blocked")
-                print(f"   Issues: {error_data['issues']}")
-            else:
-                print(f"❌ Unexpected error: {e.code}")
+        status, body = post_chat(conn, PII_CHAT_BODY)
+        if status == 400:
+            error_data = parse_json(body)
+            print("✅ PII detection working - request blocked")
+            print(f"   Issues: {error_data['issues']}")
+        elif status < 400:
+            print("⚠️  PII detection may not be working - request went through")
+        else:
+            print(f"❌ Unexpected error: {status}")
     except Exception as e:
         print(f"❌ PII test error: {e}")
     
     # Test 4: Request with Secrets (should be blocked)
     print("\n4. Testing Secret Detection...")
     try:
-        request_data = {
-            "model": "deepseek-chat",
-            "messages": [
-                {"role": "user", "content": "Here's my API key: sk-1234567890abcdef1234567890abcdef12345678"}
-            ]
-        }
-        
-        data = json.dumps(request_data).encode()
-        req = urllib.request.Request(
-            f"{base_url}/v1/chat/completions",
-            data=data,
-            headers={'Content-Type': 'application/json'}
-        )
-        
-        try:
-            with urllib.request.urlopen(req) as response:
-                result = json.loads(response.read().decode())
-                print("⚠️  Secret detection may not be working - request went through")
-        except urllib.error.HTTPError as e:
-            if e.code == 400:
-                error_data = json.loads(e.read().decode())
-                print("✅ Secret detection working - request blocked")
-                print(f"   Issues: {error_data['issues']}")
-            else:
-                print(f"❌ Unexpected error: {e.code}")
+        status, body = post_chat(conn, SECRET_CHAT_BODY)
+        if status == 400:
+            error_data = parse_json(body)
+            print("✅ Secret detection working - request blocked")
+            print(f"   Issues: {error_data['issues']}")
+        elif status < 400:
+            print("⚠️  Secret detection may not be working - request went through")
+        else:
+            print(f"❌ Unexpected error: {status}")
     except Exception as e:
         print(f"❌ Secret test error: {e}")
     
+    conn.close()
+    
     print("\n" + "=" * 50)
     print("🏁 Testing completed!")
-    print("\nTo view the gateway in browser: http://localhost:8000")
+    print(f"\nTo view the gateway in browser: http://{GATEWAY_HOST}:{GATEWAY_PORT}")
 
 
 if __name__ == "__main__":